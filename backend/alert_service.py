@@ -0,0 +1,304 @@
+"""
+Geofenced alert subscriptions.
+
+Clients register locations with a probability threshold and receive pushed updates
+over a WebSocket instead of polling /predict-disaster. Subscriptions are grouped into
+"alert" geohash cells and an inverted index maps each cell to its subscriptions,
+so a weather refresh only touches the subscribers of the cell that changed.
+
+Subscriptions are stored in subscription_store, shared by all workers on the host, and
+each worker keeps an in-memory copy of them that it re-syncs every ALERT_SYNC_INTERVAL
+seconds and whenever a client connects. WebSocket connections live in one worker; each
+worker evaluates only the cells that have a subscriber connected to it, so a subscription
+created or deleted through another worker takes effect within ALERT_SYNC_INTERVAL.
+"""
+import asyncio
+import secrets
+import time
+import numpy as np
+from typing import Dict, Set, Optional, List
+from config import (
+    CELL_PRECISION, ALERT_EVALUATION_INTERVAL, ALERT_REFRESH_INTERVAL, ALERT_MAX_CELLS_PER_PASS, ALERT_FETCH_BATCH,
+    ALERT_MIN_CHANGE, ALERT_MAX_SUBSCRIPTIONS_PER_CLIENT, ALERT_CLIENT_QUEUE_SIZE, ALERT_SYNC_INTERVAL
+)
+import subscription_store
+from weather_service import get_weather_data, add_weather_refresh_listener, CALLS_PER_FETCH
+from rate_limiter import burst, pace, request_priority, PRIORITY_LOW
+from geographic_service import get_elevations, classify_terrain_array, get_seismic_zones, get_climate_zones
+from records import WeatherReport, GeoFeatures, Terrain, ClimateZone
+from utils import (
+    calculate_rule_based_probability, get_primary_threats_rule_based, get_risk_level, canonical_cell, parent_cell
+)
+
+Cell = str
+
+
+class Subscription:
+    __slots__ = ("id", "client_id", "cell", "latitude", "longitude", "threshold", "active", "last_probability")
+
+    def __init__(self, id: str, client_id: str, cell: Cell, latitude: float, longitude: float, threshold: float):
+        self.id = id
+        self.client_id = client_id
+        self.cell = cell
+        self.latitude = latitude
+        self.longitude = longitude
+        self.threshold = threshold
+        self.active = False  # probability currently at or above threshold
+        self.last_probability = None
+
+
+class CellState:
+    __slots__ = ("latitude", "longitude", "geo_data", "weather_data", "probability", "checked_at")
+
+    def __init__(self, latitude: float, longitude: float):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.geo_data: Optional[GeoFeatures] = None
+        self.weather_data: Optional[WeatherReport] = None  # last weather the cell was scored with
+        self.probability: Optional[float] = None
+        self.checked_at = 0.0
+
+
+_subscriptions: Dict[str, Subscription] = {}
+_cell_subscribers: Dict[Cell, Set[str]] = {}
+_cells: Dict[Cell, CellState] = {}
+_client_subscriptions: Dict[str, Set[str]] = {}
+_client_queues: Dict[str, Set[asyncio.Queue]] = {}
+
+
+async def subscribe(client_id: str, lat: float, lon: float, threshold: float) -> Subscription:
+    """Register a location; raises ValueError when the client is at its subscription limit"""
+    cell, _, _ = canonical_cell(lat, lon, "alert")
+    subscription = Subscription(f"sub-{secrets.token_urlsafe(12)}", client_id, cell, lat, lon, threshold)
+    if subscription_store.enabled():
+        added = await subscription_store.add_subscription(
+            (subscription.id, client_id, cell, lat, lon, threshold), ALERT_MAX_SUBSCRIPTIONS_PER_CLIENT)
+    else:
+        added = len(_client_subscriptions.get(client_id, ())) < ALERT_MAX_SUBSCRIPTIONS_PER_CLIENT
+    if not added:
+        raise ValueError(f"At most {ALERT_MAX_SUBSCRIPTIONS_PER_CLIENT} subscriptions per client")
+    _add(subscription)
+    return subscription
+
+
+async def unsubscribe(subscription_id: str, client_id: str) -> bool:
+    """Remove a subscription owned by client_id; False if there is none"""
+    if subscription_store.enabled():
+        removed = await subscription_store.remove_subscription(subscription_id, client_id)
+    else:
+        subscription = _subscriptions.get(subscription_id)
+        removed = subscription is not None and subscription.client_id == client_id
+    if removed:
+        _remove(subscription_id)
+    return removed
+
+
+async def sync_subscriptions():
+    """Bring this worker's copy in line with the shared store"""
+    if not subscription_store.enabled():
+        return
+    rows = await subscription_store.load_subscriptions()
+    stored = {row[0] for row in rows}
+    for subscription_id in [s for s in _subscriptions if s not in stored]:
+        _remove(subscription_id)
+    for row in rows:
+        if row[0] not in _subscriptions:
+            _add(Subscription(*row))
+
+
+def _add(subscription: Subscription):
+    """Index a subscription, alerting it at once if its cell is already above the threshold"""
+    _subscriptions[subscription.id] = subscription
+    _client_subscriptions.setdefault(subscription.client_id, set()).add(subscription.id)
+    _cell_subscribers.setdefault(subscription.cell, set()).add(subscription.id)
+    state = _cells.get(subscription.cell)
+    if state is None:
+        _, center_lat, center_lon = canonical_cell(subscription.latitude, subscription.longitude, "alert")
+        _cells[subscription.cell] = CellState(center_lat, center_lon)
+    elif state.probability is not None and state.probability >= subscription.threshold:
+        # Later rescores only report changes
+        subscription.active = True
+        subscription.last_probability = state.probability
+        _push(subscription.client_id, _alert_message(subscription, state, _threats(state)))
+
+
+def _remove(subscription_id: str):
+    subscription = _subscriptions.pop(subscription_id, None)
+    if subscription is None:
+        return
+    owned = _client_subscriptions.get(subscription.client_id)
+    if owned is not None:
+        owned.discard(subscription_id)
+        if not owned:
+            del _client_subscriptions[subscription.client_id]
+    subscribers = _cell_subscribers.get(subscription.cell)
+    if subscribers is not None:
+        subscribers.discard(subscription_id)
+        if not subscribers:
+            del _cell_subscribers[subscription.cell]
+            del _cells[subscription.cell]
+
+
+async def connect(client_id: str) -> asyncio.Queue:
+    """Open a delivery queue for a client connection, starting with its currently active alerts"""
+    await sync_subscriptions()  # subscriptions may have been made through another worker
+    queue = asyncio.Queue(maxsize=ALERT_CLIENT_QUEUE_SIZE)
+    for subscription_id in _client_subscriptions.get(client_id, ()):
+        subscription = _subscriptions[subscription_id]
+        if subscription.active and not queue.full():
+            state = _cells[subscription.cell]
+            queue.put_nowait(_alert_message(subscription, state, _threats(state)))
+    _client_queues.setdefault(client_id, set()).add(queue)
+    return queue
+
+
+def disconnect(client_id: str, queue: asyncio.Queue):
+    queues = _client_queues.get(client_id)
+    if queues is not None:
+        queues.discard(queue)
+        if not queues:
+            del _client_queues[client_id]
+
+
+def stats() -> Dict[str, int]:
+    return {
+        "subscriptions": len(_subscriptions),
+        "cells": len(_cells),
+        "connected_clients": len(_client_queues)
+    }
+
+
+def _push(client_id: str, message: Dict):
+    for queue in _client_queues.get(client_id, ()):
+        if queue.full():
+            queue.get_nowait()  # drop the oldest update for slow consumers
+        queue.put_nowait(message)
+
+
+def _threats(state: CellState) -> List[str]:
+    return get_primary_threats_rule_based(state.weather_data, state.geo_data)
+
+
+def _alert_message(subscription: Subscription, state: CellState, threats: List[str]) -> Dict:
+    return {
+        "type": "alert" if subscription.active else "cleared",
+        "subscription_id": subscription.id,
+        "latitude": subscription.latitude,
+        "longitude": subscription.longitude,
+        "probability": state.probability,
+        "risk_level": get_risk_level(state.probability),
+        "primary_threats": threats,
+        "weather_timestamp": state.weather_data.timestamp
+    }
+
+
+def rescore_cell(cell: Cell, weather_data: WeatherReport):
+    """Re-score a cell from fresh weather and fan out to the subscribers whose state changed"""
+    state = _cells.get(cell)
+    if state is None or state.geo_data is None:
+        return
+    state.checked_at = time.time()
+    if state.weather_data is not None and weather_data.timestamp == state.weather_data.timestamp:
+        return
+    state.weather_data = weather_data
+
+    probability = calculate_rule_based_probability(weather_data, state.geo_data)
+    if probability == state.probability:
+        return
+    state.probability = probability
+    threats = None
+
+    for subscription_id in _cell_subscribers.get(cell, ()):
+        subscription = _subscriptions[subscription_id]
+        above = probability >= subscription.threshold
+        if above:
+            changed = not subscription.active or abs(probability - subscription.last_probability) >= ALERT_MIN_CHANGE
+        else:
+            changed = subscription.active
+        if not changed:
+            continue
+
+        if threats is None:
+            threats = _threats(state)
+        subscription.active = above
+        subscription.last_probability = probability
+        _push(subscription.client_id, _alert_message(subscription, state, threats))
+
+
+def _on_weather_refresh(weather_cell: str, weather_data: WeatherReport):
+    cell = parent_cell(weather_cell, CELL_PRECISION["alert"])
+    if cell in _cells:
+        rescore_cell(cell, weather_data)
+
+
+async def _load_geo_data(cells: List[Cell]):
+    """Resolve the geography of new cells with one batched elevation lookup"""
+    states = [_cells[cell] for cell in cells]
+    lats = np.array([state.latitude for state in states])
+    lons = np.array([state.longitude for state in states])
+    elevations = await get_elevations(lats, lons)
+    terrain = classify_terrain_array(elevations)
+    seismic = get_seismic_zones(lats, lons)
+    climate = get_climate_zones(lats, lons)
+    for i, state in enumerate(states):
+        state.geo_data = GeoFeatures(
+            float(elevations[i]), Terrain(terrain[i]), int(seismic[i]), ClimateZone(climate[i]), "open-meteo")
+
+
+def _has_local_client(cell: Cell) -> bool:
+    return any(_subscriptions[s].client_id in _client_queues for s in _cell_subscribers.get(cell, ()))
+
+
+async def evaluate_stale_cells():
+    """
+    One evaluator pass: refresh weather for the cells checked least recently, among those
+    with a subscriber connected to this worker (other workers serve the rest)
+    """
+    now = time.time()
+    stale = sorted(
+        (cell for cell, state in _cells.items()
+         if now - state.checked_at >= ALERT_REFRESH_INTERVAL and _has_local_client(cell)),
+        key=lambda cell: _cells[cell].checked_at
+    )[:ALERT_MAX_CELLS_PER_PASS]
+    if not stale:
+        return
+
+    new_cells = [cell for cell in stale if _cells[cell].geo_data is None]
+    if new_cells:
+        await _load_geo_data(new_cells)
+
+    # Small paced batches at low priority, so the evaluator only uses quota user requests leave free
+    batch_size = max(1, min(ALERT_FETCH_BATCH, burst("openweather") // CALLS_PER_FETCH))
+    for start in range(0, len(stale), batch_size):
+        # Snapshot the states: cells may be unsubscribed while this batch waits
+        batch = [(cell, _cells[cell]) for cell in stale[start:start + batch_size] if cell in _cells]
+        await pace("openweather", CALLS_PER_FETCH * len(batch))
+        results = await asyncio.gather(
+            *(get_weather_data(state.latitude, state.longitude) for _, state in batch),
+            return_exceptions=True
+        )
+        checked_at = time.time()
+        for (cell, state), weather_data in zip(batch, results):
+            if _cells.get(cell) is not state:
+                continue  # unsubscribed meanwhile
+            state.checked_at = checked_at  # failed cells wait for the next refresh interval too
+            if isinstance(weather_data, Exception):
+                print(f"Alert evaluator weather error: {str(weather_data)}")
+            else:
+                rescore_cell(cell, weather_data)
+
+
+async def run_alert_evaluator():
+    """Background task started with the app"""
+    add_weather_refresh_listener(_on_weather_refresh)
+    request_priority.set(PRIORITY_LOW)
+    evaluated_at = 0.0
+    while True:
+        try:
+            await sync_subscriptions()
+            if time.monotonic() - evaluated_at >= ALERT_EVALUATION_INTERVAL:
+                evaluated_at = time.monotonic()
+                await evaluate_stale_cells()
+        except Exception as e:
+            print(f"Alert evaluator error: {str(e)}")
+        await asyncio.sleep(ALERT_SYNC_INTERVAL)
@@ -0,0 +1,86 @@
+"""
+Compare the verbose and compact Groq analysis modes.
+
+Fetches weather/geo/location data once for the given coordinates, then sends the same
+analysis request in each mode and reports prompt tokens, completion tokens and latency.
+
+Usage:
+    python bench_llm_modes.py [--lat 19.0760] [--lon 72.8777] [--runs 3]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from groq import AsyncGroq
+from pydantic import ValidationError
+from config import GROQ_API_KEY
+from models import DisasterAnalysis
+from weather_service import get_weather_data
+from geographic_service import get_geographic_data, get_location_info
+from disaster_analysis import (
+    ANALYSIS_MODE_VERBOSE, ANALYSIS_MODE_COMPACT, _request_analysis, _parse_llm_response
+)
+
+
+async def run_mode(client: AsyncGroq, mode: str, runs: int, inputs: tuple) -> dict:
+    prompt_tokens, completion_tokens, latencies, valid = [], [], [], 0
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        completion = await _request_analysis(client, *inputs, mode)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        prompt_tokens.append(completion.usage.prompt_tokens)
+        completion_tokens.append(completion.usage.completion_tokens)
+
+        content = completion.choices[0].message.content
+        try:
+            parsed = json.loads(content) if mode == ANALYSIS_MODE_COMPACT else _parse_llm_response(content)
+            DisasterAnalysis.model_validate(parsed)
+            valid += 1
+        except (ValueError, ValidationError):
+            pass
+
+    return {
+        "mode": mode,
+        "prompt_tokens": statistics.mean(prompt_tokens),
+        "completion_tokens": statistics.mean(completion_tokens),
+        "latency_ms": statistics.median(latencies),
+        "valid": f"{valid}/{runs}"
+    }
+
+
+async def main(lat: float, lon: float, runs: int):
+    if not GROQ_API_KEY:
+        raise SystemExit("GROQ_API_KEY is required to run this comparison")
+
+    weather_data, geo_data, location_info = await asyncio.gather(
+        get_weather_data(lat, lon),
+        get_geographic_data(lat, lon),
+        get_location_info(lat, lon)
+    )
+    inputs = (weather_data, geo_data, location_info, lat, lon)
+    client = AsyncGroq(api_key=GROQ_API_KEY)
+
+    results = [await run_mode(client, mode, runs, inputs)
+               for mode in (ANALYSIS_MODE_VERBOSE, ANALYSIS_MODE_COMPACT)]
+
+    print(f"{'mode':<10}{'prompt tok':>12}{'compl tok':>12}{'latency ms':>12}{'valid':>8}")
+    for r in results:
+        print(f"{r['mode']:<10}{r['prompt_tokens']:>12.0f}{r['completion_tokens']:>12.0f}"
+              f"{r['latency_ms']:>12.0f}{r['valid']:>8}")
+
+    verbose, compact = results
+    for key in ("prompt_tokens", "completion_tokens", "latency_ms"):
+        if verbose[key]:
+            print(f"{key}: {100 * (1 - compact[key] / verbose[key]):.1f}% reduction")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lat", type=float, default=19.0760)
+    parser.add_argument("--lon", type=float, default=72.8777)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.lat, args.lon, args.runs))
@@ -0,0 +1,151 @@
+"""
+Measure the per-request memory of the internal weather/geo/location data.
+
+Compares the previous nested-dict pipeline, which kept the decoded upstream JSON (the
+OpenWeather current conditions, the open-meteo elevation response and the full
+bigdatacloud payload) in every cached entry, against the slotted records of records.py,
+which are built once at the upstream boundary. Both start from the same raw response
+bytes and build the same forecast columns. Reported per request: bytes retained while
+the data is cached, live allocations (blocks) retained, and the peak allocation while
+building it.
+
+Usage:
+    python bench_records.py [--requests 2000]
+"""
+import argparse
+import json
+import tracemalloc
+from datetime import datetime
+from records import (
+    WeatherReport, WeatherObservation, ForecastSeries, GeoFeatures, LocationInfo, Terrain, ClimateZone
+)
+
+FEATURE_NAMES = ("max_rain_24h", "max_rain_72h", "max_pressure_drop_3h", "min_pressure", "peak_wind", "max_temp")
+
+
+def sample_payloads() -> tuple:
+    """Raw response bodies shaped like real OpenWeather, open-meteo and bigdatacloud replies"""
+    current = {
+        "coord": {"lon": 72.8777, "lat": 19.076},
+        "weather": [{"id": 501, "main": "Rain", "description": "moderate rain", "icon": "10d"}],
+        "base": "stations",
+        "main": {"temp": 29.4, "feels_like": 35.1, "temp_min": 28.9, "temp_max": 29.9, "pressure": 1004,
+                 "humidity": 84, "sea_level": 1004, "grnd_level": 1003},
+        "visibility": 4000, "wind": {"speed": 7.2, "deg": 250, "gust": 11.3}, "rain": {"1h": 3.6},
+        "clouds": {"all": 75}, "dt": 1760860800,
+        "sys": {"type": 1, "id": 9052, "country": "IN", "sunrise": 1760836000, "sunset": 1760878000},
+        "timezone": 19800, "id": 1275339, "name": "Mumbai", "cod": 200
+    }
+    forecast = {"list": [
+        {"dt": 1760860800 + 10800 * i, "main": {"temp": 28 + i % 4, "pressure": 1004 - i % 6},
+         "wind": {"speed": 6 + i % 5}, "rain": {"3h": 2.5 * (i % 3)}}
+        for i in range(40)
+    ]}
+    elevation = {"elevation": [14.0]}
+    location = {
+        "latitude": 19.076, "longitude": 72.8777, "lookupSource": "coordinates",
+        "localityLanguageRequested": "en", "continent": "Asia", "continentCode": "AS",
+        "countryName": "India", "countryCode": "IN", "principalSubdivision": "Maharashtra",
+        "principalSubdivisionCode": "IN-MH", "city": "Mumbai", "locality": "Mumbai", "postcode": "400001",
+        "plusCode": "7JFJ3V3G+C3",
+        "localityInfo": {
+            "administrative": [
+                {"name": f"Admin level {i}", "description": "administrative region of India " * 3,
+                 "isoName": f"IN-{i}", "order": i, "adminLevel": i, "isoCode": f"IN-MH-{i}",
+                 "wikidataId": f"Q{1000 + i}", "geonameId": 1260000 + i}
+                for i in range(10)
+            ],
+            "informative": [
+                {"name": f"Feature {i}", "description": "informative locality description text " * 4,
+                 "order": i, "wikidataId": f"Q{2000 + i}", "geonameId": 1270000 + i}
+                for i in range(25)
+            ]
+        }
+    }
+    return tuple(json.dumps(payload).encode() for payload in (current, forecast, elevation, location))
+
+
+def build_dicts(current_body: bytes, forecast_body: bytes, elevation_body: bytes, location_body: bytes) -> tuple:
+    """The previous pipeline: nested dicts that keep the decoded upstream JSON"""
+    forecast = ForecastSeries.from_openweather(json.loads(forecast_body))
+    features = forecast.features()
+    weather = {
+        "current": json.loads(current_body),
+        "forecast": forecast,
+        "forecast_features": {name: getattr(features, name) for name in FEATURE_NAMES},
+        "timestamp": datetime.now().isoformat()
+    }
+    elevation_data = json.loads(elevation_body)
+    geo = {
+        "elevation": elevation_data["elevation"][0], "terrain": "plain", "seismic_zone": 3,
+        "climate_zone": "tropical_wet", "raw_data": {"elevation": elevation_data, "source": "open-meteo"}
+    }
+    data = json.loads(location_body)
+    location = {
+        "city": data.get("city", "Unknown"),
+        "state": data.get("principalSubdivision", "Unknown"),
+        "district": data.get("localityInfo", {}).get("administrative", [{}])[0].get("name", "Unknown"),
+        "country": data.get("countryName", "India"),
+        "postal_code": data.get("postcode", ""),
+        "locality": data.get("locality", ""),
+        "raw_data": data
+    }
+    return weather, geo, location
+
+
+def build_records(current_body: bytes, forecast_body: bytes, elevation_body: bytes, location_body: bytes) -> tuple:
+    """The typed pipeline, as in weather_service and geographic_service"""
+    weather = WeatherReport(
+        WeatherObservation.from_openweather(json.loads(current_body)),
+        ForecastSeries.from_openweather(json.loads(forecast_body)),
+        datetime.now().isoformat()
+    )
+    geo = GeoFeatures(json.loads(elevation_body)["elevation"][0], Terrain.PLAIN, 3, ClimateZone.TROPICAL_WET,
+                      "open-meteo")
+    location = LocationInfo.from_bigdatacloud(json.loads(location_body))
+    return weather, geo, location
+
+
+def measure(build, payloads: tuple, requests: int) -> tuple:
+    """(retained bytes, retained blocks, peak bytes) per request"""
+    build(*payloads)  # warm up interned strings and caches
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot().filter_traces(ignore)
+    kept = [build(*payloads) for _ in range(requests)]
+    after = tracemalloc.take_snapshot().filter_traces(ignore)
+    stats = after.compare_to(before, "filename")
+    retained = sum(stat.size_diff for stat in stats)
+    blocks = sum(stat.count_diff for stat in stats)
+
+    del kept
+    peaks = []
+    for _ in range(5):  # the first build after a large free is noisy
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        build(*payloads)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+    peak = min(peaks)
+    return retained / requests, blocks / requests, peak
+
+
+def main(requests: int):
+    payloads = sample_payloads()
+    cases = [("nested dicts", build_dicts), ("records", build_records)]
+
+    baseline = None
+    print(f"{'case':<14}{'bytes/req':>12}{'blocks/req':>12}{'peak bytes':>12}{'bytes %':>10}{'blocks %':>10}")
+    for name, build in cases:
+        retained, blocks, peak = measure(build, payloads, requests)
+        if baseline is None:
+            baseline = (retained, blocks)
+        print(f"{name:<14}{retained:>12.0f}{blocks:>12.1f}{peak:>12}"
+              f"{100 * retained / baseline[0]:>9.0f}%{100 * blocks / baseline[1]:>9.0f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    main(parser.parse_args().requests)
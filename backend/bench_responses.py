@@ -0,0 +1,62 @@
+"""
+Measure /predict-disaster response size and serialization time.
+
+Compares the standard JSON encoder against orjson for the response the server returns,
+and a ?fields= projection, using a prediction shaped like a real one: geography and
+location built from the records in records.py and a full five-hazard analysis.
+
+Usage:
+    python bench_responses.py [--iterations 2000]
+"""
+import argparse
+import timeit
+from fastapi.responses import JSONResponse, ORJSONResponse
+from models import DisasterPrediction
+from records import GeoFeatures, LocationInfo, Terrain, ClimateZone
+from utils import parse_fields, project_fields
+
+
+def sample_prediction() -> dict:
+    """Build a prediction as /predict-disaster returns it"""
+    hazard = {
+        "probability": 35.0, "risk_level": "Medium",
+        "recommendations": ["Move valuables above ground level", "Avoid underpasses during heavy rain",
+                            "Keep a go-bag ready"],
+        "analysis": "Moderate risk given current rainfall, humidity and the low-lying coastal terrain."
+    }
+    analysis = {name: dict(hazard) for name in ("floods", "cyclone", "earthquakes", "droughts", "landslides")}
+    analysis["conclusion"] = dict(hazard, primary_threats=["flooding", "cyclone"])
+
+    return DisasterPrediction(
+        geographic_data=GeoFeatures(14.0, Terrain.PLAIN, 3, ClimateZone.TROPICAL_WET, "open-meteo").to_dict(),
+        location_info=LocationInfo("Mumbai", "Maharashtra", "Mumbai", "India", "400001", "Mumbai").to_dict(),
+        analysis=analysis
+    ).model_dump()
+
+
+def main(iterations: int):
+    prediction = sample_prediction()
+    projected = project_fields(prediction, parse_fields("analysis.conclusion,location_info.city"))
+
+    cases = [
+        ("full + json", JSONResponse, prediction),
+        ("full + orjson", ORJSONResponse, prediction),
+        ("fields + orjson", ORJSONResponse, projected),
+    ]
+
+    baseline_bytes = baseline_us = None
+    print(f"{'case':<18}{'bytes':>10}{'us/resp':>10}{'bytes %':>10}{'time %':>10}")
+    for name, response_class, content in cases:
+        size = len(response_class(content).body)
+        seconds = timeit.timeit(lambda: response_class(content).body, number=iterations)
+        micros = seconds / iterations * 1e6
+        if baseline_bytes is None:
+            baseline_bytes, baseline_us = size, micros
+        print(f"{name:<18}{size:>10}{micros:>10.1f}"
+              f"{100 * size / baseline_bytes:>9.0f}%{100 * micros / baseline_us:>9.0f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    main(parser.parse_args().iterations)
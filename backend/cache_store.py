@@ -0,0 +1,273 @@
+"""
+Shared cache for upstream responses and analyses.
+
+Entries live in a SQLite database in WAL mode so every uvicorn worker on the host
+shares them and they survive restarts. Each worker keeps a small in-memory LRU in
+front of the database, which warm_start() fills from the most recently used rows.
+Values are stored as JSON; readers that keep typed records (see records.py) pass a
+decode function, and the memory layer then holds the decoded record.
+
+SQLite is never touched from the event loop while serving: reads that miss the memory
+layer run in a thread, and writes and access-time updates go to a background writer
+thread that commits them in batches, so a worker waiting for another worker's write
+lock only delays the cache, not every request it is serving.
+"""
+import asyncio
+import json
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+from config import CACHE_DB_PATH, CACHE_MAX_BYTES, CACHE_MEMORY_ENTRIES, CACHE_EVICT_EVERY, CACHE_WRITE_BATCH
+
+_reader: Optional[sqlite3.Connection] = None
+_read_lock = threading.Lock()
+_memory: "OrderedDict[str, tuple]" = OrderedDict()
+_writer: Optional["_CacheWriter"] = None
+
+
+def _connect() -> sqlite3.Connection:
+    connection = sqlite3.connect(CACHE_DB_PATH, timeout=5.0, check_same_thread=False, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("PRAGMA busy_timeout=5000")
+    connection.execute(
+        """
+        CREATE TABLE IF NOT EXISTS cache (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            expires_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        )
+        """
+    )
+    connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+    return connection
+
+
+def _get_reader() -> Optional[sqlite3.Connection]:
+    global _reader
+    if _reader is None and CACHE_DB_PATH:
+        _reader = _connect()
+    return _reader
+
+
+def _remember(full_key: str, expires_at: float, value: Any):
+    _memory[full_key] = (expires_at, value)
+    _memory.move_to_end(full_key)
+    while len(_memory) > CACHE_MEMORY_ENTRIES:
+        _memory.popitem(last=False)
+
+
+def _read(full_key: str, now: float) -> Optional[Tuple[Any, float]]:
+    """Load and decompress a live row; runs in a worker thread"""
+    with _read_lock:
+        connection = _get_reader()
+        if connection is None:
+            return None
+        row = connection.execute("SELECT value, expires_at FROM cache WHERE key = ?", (full_key,)).fetchone()
+    if row is None or row[1] <= now:
+        return None
+    return json.loads(zlib.decompress(row[0])), row[1]
+
+
+async def cache_get(namespace: str, key: str, decode: Optional[Callable[[Any], Any]] = None) -> Optional[Any]:
+    """
+    Return the cached value or None if it is missing or expired.
+    decode turns the stored JSON back into the original object; it may return None for
+    entries in an outdated format, which then count as missing.
+    """
+    full_key = f"{namespace}:{key}"
+    now = time.time()
+
+    entry = _memory.get(full_key)
+    if entry is not None:
+        if entry[0] > now:
+            _memory.move_to_end(full_key)
+            if decode is not None and isinstance(entry[1], dict):
+                # Filled by warm_start(), which does not know the record types
+                return _decoded(full_key, entry[0], entry[1], decode)
+            return entry[1]
+        del _memory[full_key]
+
+    if not CACHE_DB_PATH:
+        return None
+    try:
+        loaded = await asyncio.to_thread(_read, full_key, now)
+    except sqlite3.Error as e:
+        print(f"Cache read error: {str(e)}")
+        return None
+    if loaded is None:
+        return None
+
+    value, expires_at = loaded
+    _get_writer().touch(full_key, now)
+    if decode is not None:
+        return _decoded(full_key, expires_at, value, decode)
+    _remember(full_key, expires_at, value)
+    return value
+
+
+def _decoded(full_key: str, expires_at: float, value: Any, decode: Callable[[Any], Any]) -> Optional[Any]:
+    """Decode a stored value and keep the result in the memory layer, with the same expiry"""
+    value = decode(value)
+    if value is None:
+        _memory.pop(full_key, None)
+        return None
+    _remember(full_key, expires_at, value)
+    return value
+
+
+def cache_set(namespace: str, key: str, value: Any, ttl: float):
+    """Store a JSON-serializable value for ttl seconds; the database write happens in the background"""
+    full_key = f"{namespace}:{key}"
+    now = time.time()
+    expires_at = now + ttl
+    blob = zlib.compress(json.dumps(value, separators=(",", ":"), default=_encode).encode(), 1)
+
+    _remember(full_key, expires_at, value)
+    if CACHE_DB_PATH:
+        _get_writer().put(full_key, blob, expires_at, now)
+
+
+def _encode(value: Any) -> Any:
+    """Serialize objects that know their JSON form (e.g. ForecastSeries)"""
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class _CacheWriter(threading.Thread):
+    """
+    Applies queued writes and access-time updates in batches of up to CACHE_WRITE_BATCH per
+    transaction. Repeated reads of a key between two commits cost one UPDATE.
+    """
+
+    _STOP = object()
+
+    def __init__(self):
+        super().__init__(name="cache-writer", daemon=True)
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._writes_since_evict = 0
+
+    def put(self, full_key: str, blob: bytes, expires_at: float, now: float):
+        self._queue.put((full_key, blob, expires_at, now))
+
+    def touch(self, full_key: str, now: float):
+        self._queue.put((full_key, None, None, now))
+
+    def stop(self):
+        self._queue.put(self._STOP)
+        self.join()
+
+    def run(self):
+        connection = _connect()
+        stopping = False
+        while not stopping:
+            rows: Dict[str, tuple] = {}
+            touched: Dict[str, float] = {}
+            item = self._queue.get()
+            while True:
+                if item is self._STOP:
+                    stopping = True
+                else:
+                    full_key, blob, expires_at, now = item
+                    if blob is None:
+                        touched[full_key] = now
+                    else:
+                        rows[full_key] = (full_key, blob, len(blob), expires_at, now)
+                if len(rows) + len(touched) >= CACHE_WRITE_BATCH:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if rows or touched:
+                self._commit(connection, rows, touched)
+        connection.close()
+
+    def _commit(self, connection: sqlite3.Connection, rows: Dict[str, tuple], touched: Dict[str, float]):
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                rows.values()
+            )
+            connection.executemany(
+                "UPDATE cache SET accessed_at = ? WHERE key = ?",
+                [(now, full_key) for full_key, now in touched.items() if full_key not in rows]
+            )
+            self._writes_since_evict += len(rows)
+            if self._writes_since_evict >= CACHE_EVICT_EVERY:
+                self._writes_since_evict = 0
+                _evict(connection, time.time())
+            connection.execute("COMMIT")
+        except sqlite3.Error as e:
+            print(f"Cache write error: {str(e)}")
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+
+
+def _get_writer() -> _CacheWriter:
+    global _writer
+    if _writer is None:
+        _writer = _CacheWriter()
+        _writer.start()
+    return _writer
+
+
+def _evict(connection: sqlite3.Connection, now: float):
+    """Drop expired rows, then least recently used rows until the database is under 90% of the cap"""
+    connection.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+    total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+    if total <= CACHE_MAX_BYTES:
+        return
+
+    excess = total - int(CACHE_MAX_BYTES * 0.9)
+    freed = 0
+    victims = []
+    for key, size in connection.execute("SELECT key, size FROM cache ORDER BY accessed_at"):
+        victims.append((key,))
+        freed += size
+        if freed >= excess:
+            break
+    connection.executemany("DELETE FROM cache WHERE key = ?", victims)
+    print(f"Cache evicted {len(victims)} entries ({freed} bytes)")
+
+
+def warm_start(limit: int = CACHE_MEMORY_ENTRIES) -> int:
+    """Load the most recently used live entries into this worker's memory layer (at startup, before serving)"""
+    now = time.time()
+    with _read_lock:
+        try:
+            connection = _get_reader()
+            if connection is None:
+                return 0
+            rows = connection.execute(
+                "SELECT key, value, expires_at FROM cache WHERE expires_at > ? ORDER BY accessed_at DESC LIMIT ?",
+                (now, limit)
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Cache warm start error: {str(e)}")
+            return 0
+
+    for key, blob, expires_at in reversed(rows):
+        _remember(key, expires_at, json.loads(zlib.decompress(blob)))
+    return len(rows)
+
+
+def close_cache():
+    """Flush pending writes and close the database"""
+    global _reader, _writer
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
+    with _read_lock:
+        if _reader is not None:
+            _reader.close()
+            _reader = None
+    _memory.clear()
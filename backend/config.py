@@ -10,6 +10,89 @@ GROQ_API_KEY = "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"
 
 # Server Configuration
 PORT = 8000
+WORKERS = max(1, int(os.getenv("WORKERS", "1")))  # uvicorn worker processes (see run.sh)
+
+# Groq LLM Configuration
+GROQ_MODEL = "openai/gpt-oss-120b"
+# "compact" uses structured JSON output with a minimal prompt, "verbose" the original free-text prompt
+GROQ_ANALYSIS_MODE = os.getenv("GROQ_ANALYSIS_MODE", "compact")
+GROQ_VERBOSE_MAX_TOKENS = 2500
+GROQ_COMPACT_MAX_TOKENS = 1200
+GROQ_COMPACT_TEMPERATURE = 0.2
+GROQ_REASONING_EFFORT = "low"
+GROQ_BULK_MAX_SITES = 8  # locations packed into one bulk completion
+GROQ_BULK_TOKENS_PER_SITE = 900
+# Per /predict-disaster/bulk request. Uncached weather cells cost two OpenWeather calls each
+# and are paced to the worker's share of the rate limit; a bulk request whose uncached cells
+# need more than BULK_MAX_WEATHER_SECONDS of that quota is rejected up front with a 503.
+# At the default limits one worker serves 20 uncached cells in about 30s.
+BULK_MAX_LOCATIONS = 20
+BULK_MAX_WEATHER_SECONDS = 30.0
+
+# Shared cache (SQLite in WAL mode, shared by every uvicorn worker on the host)
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache.sqlite3"))
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+CACHE_MEMORY_ENTRIES = 2000  # per-worker in-memory layer, also the warm-start size
+CACHE_EVICT_EVERY = 200  # writes between size checks
+CACHE_WRITE_BATCH = 100  # writes and access-time updates committed per transaction by the writer thread
+CACHE_TTL_WEATHER = 10 * 60
+CACHE_TTL_GEOGRAPHIC = 7 * 24 * 3600
+CACHE_TTL_LOCATION = 7 * 24 * 3600
+CACHE_TTL_ANALYSIS = 30 * 60
+CACHE_TTL_FACILITY = 6 * 3600
+CACHE_TTL_EXPOSURE = 7 * 24 * 3600
+
+# Geohash cell precision per data source; requests in the same cell share cached data.
+# 4 ≈ 39 x 20 km, 5 ≈ 4.9 x 4.9 km, 6 ≈ 1.2 x 0.6 km, 7 ≈ 153 x 153 m
+CELL_PRECISION = {
+    "weather": 5,
+    "geo": 7,       # elevation and terrain
+    "location": 6,  # reverse geocoding
+    "analysis": 6,
+    "route": 6,     # route corridor segments
+    "route_weather": 4,  # one weather fetch per cell along a route; must be at most "route"
+    "alert": 5,     # must equal "weather" so a weather refresh maps to one alert cell
+    "track": 6,     # must be at least "weather"
+    "facility": 6,  # facility selection decisions
+    "buildings": 7,  # /buildings-emergency query centre
+    "exposure": 6,  # building exposure from /buildings-emergency, read by predictions
+}
+
+# HTTP caching (see http_cache.py): max-age sent to clients and proxies, in seconds
+HTTP_MAX_AGE_PREDICTION = 5 * 60  # shorter than CACHE_TTL_WEATHER, which versions predictions
+HTTP_MAX_AGE_BUILDINGS = 60 * 60  # also how long a /buildings-emergency ETag is honoured
+
+# Upstream rate limits for the whole host: sustained requests/second and burst size.
+# Each of the WORKERS processes gets rate / WORKERS and burst // WORKERS (at least 1).
+UPSTREAM_RATE_LIMITS = {
+    "groq": {"rate": 0.5, "burst": 5},         # 30 requests/minute
+    "openweather": {"rate": 1.0, "burst": 10},  # 60 calls/minute
+    "overpass": {"rate": 0.2, "burst": 2},
+    "nominatim": {"rate": 1.0, "burst": 1},     # usage policy: max 1 request/second
+}
+UPSTREAM_MAX_QUEUE = 100  # waiting requests per upstream before new ones are rejected
+UPSTREAM_MAX_WAIT = 10.0  # seconds a request may wait for a token before it is shed
+
+# Load governor (see load_governor.py); thresholds are for levels cached-llm, rule-based, shed
+GOVERNOR_SAMPLE_INTERVAL = 0.1  # seconds between event-loop lag samples
+GOVERNOR_LAG_SMOOTHING = 0.3  # weight of the newest sample in the moving average
+GOVERNOR_LAG_THRESHOLDS = (0.05, 0.2, 0.5)  # seconds of event-loop lag
+GOVERNOR_IN_FLIGHT_THRESHOLDS = (100, 200, 400)  # concurrent HTTP requests
+GOVERNOR_QUEUE_THRESHOLDS = (20, 50, 90)  # requests waiting on the busiest upstream
+GOVERNOR_RECOVERY_SECONDS = 10  # calm time before stepping down one level
+GOVERNOR_NON_CRITICAL_PATHS = ("/predict-disaster/bulk", "/route-risk", "/buildings-emergency")
+
+# Process pool for CPU-bound parsing (see cpu_pool.py)
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", "0"))  # 0: cores available to this uvicorn worker
+CPU_POOL_INLINE_BYTES = 256 * 1024  # smaller payloads are parsed on the event loop
+
+# Traffic capture and replay (see traffic_capture.py and replay_traffic.py)
+TRAFFIC_CAPTURE_PATH = os.getenv("TRAFFIC_CAPTURE_PATH", "")  # append captured traffic to this .jsonl.gz log
+TRAFFIC_REPLAY_PATH = os.getenv("TRAFFIC_REPLAY_PATH", "")  # serve upstream calls from this log instead
+# Replayed upstream calls take their recorded duration; TRAFFIC_REPLAY_LATENCY=0 answers at once
+TRAFFIC_REPLAY_LATENCY = os.getenv("TRAFFIC_REPLAY_LATENCY", "1") != "0"
+TRAFFIC_CAPTURE_PATHS = ("/predict-disaster", "/buildings-emergency")
+TRAFFIC_CAPTURE_FLUSH_EVERY = 50  # records buffered before a compressed block is appended
 
 # API URLs
 OPENWEATHER_CURRENT_URL = "http://api.openweathermap.org/data/2.5/weather"
@@ -18,6 +101,56 @@ ELEVATION_API_URL = "https://api.open-meteo.com/v1/elevation"
 REVERSE_GEOCODING_URL = "https://api.bigdatacloud.net/data/reverse-geocode-client"
 NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
 
+ELEVATION_BATCH_SIZE = 100  # open-meteo accepts up to 100 coordinates per request
+
+# Route corridor assessment
+ROUTE_DEFAULT_SPACING_M = 500
+ROUTE_MIN_SPACING_M = 50
+ROUTE_MAX_SAMPLES = 2000
+# Routes whose uncached weather cells need more of the OpenWeather quota are rejected with a 503
+ROUTE_MAX_WEATHER_SECONDS = 10.0
+
+# Geofenced alert subscriptions
+ALERT_EVALUATION_INTERVAL = 30  # seconds between evaluator passes
+ALERT_SYNC_INTERVAL = 5  # seconds between re-reads of the subscriptions shared by all workers
+ALERT_REFRESH_INTERVAL = 10 * 60  # re-check a cell's weather at most this often
+ALERT_MAX_CELLS_PER_PASS = 200
+ALERT_FETCH_BATCH = 2  # cells whose weather is fetched together, paced to the OpenWeather limit
+ALERT_MIN_CHANGE = 5.0  # probability points before a still-active alert is re-sent
+ALERT_MAX_SUBSCRIPTIONS_PER_CLIENT = 50
+ALERT_CLIENT_QUEUE_SIZE = 100
+
+# Emergency facility selection
+OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+OVERPASS_MAX_RADIUS_M = 10000
+OVERPASS_TILE_SIZE_M = 10000  # larger areas are split into sub-boxes of at most this size...
+# ...up to this many; beyond it the sub-boxes grow instead. With 10 km tiles every radius up
+# to 5 km (FACILITY_DEFAULT_RADIUS_M) is a single query, and this bounds the Overpass tokens
+# per request.
+OVERPASS_MAX_SUB_BOXES = 4
+OVERPASS_MAX_CONCURRENT = 2  # concurrent Overpass queries per worker (politeness limit)
+# Responses are parsed as they stream in, this many bytes per call (in the CPU pool); only
+# the compact parsed elements of a response are held, never its raw body
+OVERPASS_PARSE_CHUNK_BYTES = 1024 * 1024
+# Each sub-box takes one Overpass rate-limit token; areas whose sub-boxes need more of the
+# quota than this are rejected with a 503 instead of waiting
+OVERPASS_MAX_FETCH_SECONDS = 20.0
+FACILITY_DEFAULT_RADIUS_M = 5000
+FACILITY_DISTANCE_SCALE_KM = 5.0  # proximity score halves roughly every 3.5 km
+FACILITY_ELEVATION_SCALE_M = 20.0  # height above the site that earns the full flood bonus
+FACILITY_TIE_MARGIN = 5.0  # score points; candidates this close to the best go to the LLM
+FACILITY_LLM_CANDIDATES = 5
+FACILITY_MAX_TOKENS = 400
+
+# Building exposure analytics
+EXPOSURE_TALL_HEIGHT_M = 15.0  # National Building Code of India high-rise threshold
+# Exposure stored for predictions is always computed within this radius, whatever radius the
+# /buildings-emergency request used; queries with a smaller radius do not store any
+EXPOSURE_RADIUS_M = 1000
+
+# Live position tracking
+TRACK_MAX_AGE = CACHE_TTL_WEATHER  # seconds before a prediction in the same cell is refreshed anyway
+
 # Coordinate boundaries for India
 INDIA_LAT_MIN = 6.0
 INDIA_LAT_MAX = 37.0
@@ -0,0 +1,58 @@
+"""
+Process pool for CPU-bound work such as parsing large upstream payloads.
+
+The pool is created at app startup and sized to the cores available to this worker: the
+CPUs the process may run on divided among the uvicorn workers (WORKERS). Work whose
+payload is smaller than CPU_POOL_INLINE_BYTES runs inline, where shipping it to another
+process would cost more than it saves.
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional, TypeVar
+from config import CPU_POOL_WORKERS, CPU_POOL_INLINE_BYTES, WORKERS
+
+T = TypeVar("T")
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _available_cores() -> int:
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    return max(1, cores // WORKERS)
+
+
+def _ready() -> bool:
+    return True
+
+
+def start_cpu_pool() -> int:
+    """Create the pool and start its processes; returns the number of processes"""
+    global _executor
+    workers = CPU_POOL_WORKERS or _available_cores()
+    # forkserver: children do not inherit the event loop, sockets or the cache connection
+    _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver"))
+    for future in [_executor.submit(_ready) for _ in range(workers)]:
+        future.result()
+    return workers
+
+
+def shutdown_cpu_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def run_cpu_bound(func: Callable[..., T], *args, payload_size: int) -> T:
+    """
+    Run func(*args) in the pool, or inline when the payload is small or no pool is running.
+    func and its arguments must be picklable.
+    """
+    if _executor is None or payload_size < CPU_POOL_INLINE_BYTES:
+        return func(*args)
+    return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
@@ -1,19 +1,46 @@
+import asyncio
 import json
-from typing import Dict, Any
-from groq import Groq
-from models import DisasterPrediction
-from config import GROQ_API_KEY
+import re
+from typing import Dict, Any, List, Tuple, AsyncIterator, Optional
+from groq import AsyncGroq
+from models import DisasterPrediction, DisasterAnalysis
+from records import WeatherReport, WeatherObservation, GeoFeatures, LocationInfo
+from config import (
+    GROQ_API_KEY, GROQ_MODEL, GROQ_ANALYSIS_MODE, GROQ_VERBOSE_MAX_TOKENS,
+    GROQ_COMPACT_MAX_TOKENS, GROQ_COMPACT_TEMPERATURE, GROQ_REASONING_EFFORT, CACHE_TTL_ANALYSIS,
+    GROQ_BULK_MAX_SITES, GROQ_BULK_TOKENS_PER_SITE, EXPOSURE_TALL_HEIGHT_M
+)
+from cache_store import cache_get, cache_set
+from exposure_service import exposure_digest
+from rate_limiter import acquire, UpstreamOverloaded
+from traffic_capture import groq_http_client
+from load_governor import current_level, LEVEL_CACHED_LLM, LEVEL_RULE_BASED
 from datetime import datetime
 from utils import (
     calculate_rule_based_probability,
     get_risk_level,
     get_primary_threats_rule_based,
-    get_recommendations_rule_based
+    get_recommendations_rule_based,
+    canonical_cell
+)
+
+ANALYSIS_MODE_VERBOSE = "verbose"
+ANALYSIS_MODE_COMPACT = "compact"
+
+SYSTEM_PROMPT = "You are an expert in natural disaster prediction and risk assessment for India. Provide accurate, actionable insights based on meteorological and geographic data."
+
+COMPACT_SYSTEM_PROMPT = (
+    "You assess natural disaster risk in India and reply only with JSON matching the given schema. "
+    "Weigh current weather above geography. Recommendations: 2-3 per hazard, specific to the location "
+    "and conditions, more urgent at higher risk. Keep each analysis under 40 words."
 )
 
+DEGRADED_ANALYSIS = "Rule-based analysis served while the server is under heavy load"
+
 
 async def analyze_disaster_risk_with_groq(
-    weather_data: Dict, geo_data: Dict, location_info: Dict, lat: float, lon: float
+    weather_data: WeatherReport, geo_data: GeoFeatures, location_info: LocationInfo, lat: float, lon: float,
+    mode: str = GROQ_ANALYSIS_MODE
 ) -> DisasterPrediction:
     """
     Analyze disaster risk using Groq LLM with fallback to rule-based analysis
@@ -21,36 +48,42 @@ async def analyze_disaster_risk_with_groq(
     try:
         if not GROQ_API_KEY:
             print("Groq API key not found, using rule-based analysis")
-            return create_fallback_prediction(weather_data, geo_data, location_info, "Groq API key not configured")
+            return create_fallback_prediction(
+                weather_data, geo_data, location_info, "Groq API key not configured", fallback=False)
 
-        client = Groq(api_key=GROQ_API_KEY)
+        level = current_level()
+        if level >= LEVEL_RULE_BASED:
+            return create_fallback_prediction(weather_data, geo_data, location_info, DEGRADED_ANALYSIS)
 
-        structured = _get_analysis_structure()
-        prompt = _create_analysis_prompt(
-            weather_data, geo_data, location_info, lat, lon, structured)
+        cache_key = _analysis_cache_key(weather_data, geo_data, lat, lon, mode)
+        cached = await cache_get("analysis", cache_key)
+        if cached is not None:
+            return DisasterPrediction(
+                geographic_data=geo_data.to_dict(),
+                location_info=location_info.to_dict(),
+                analysis=cached
+            )
+        if level >= LEVEL_CACHED_LLM:
+            return create_fallback_prediction(weather_data, geo_data, location_info, DEGRADED_ANALYSIS)
 
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert in natural disaster prediction and risk assessment for India. Provide accurate, actionable insights based on meteorological and geographic data."
-                },
-                {"role": "user", "content": prompt}
-            ],
-            model="openai/gpt-oss-120b",
-            temperature=0.5,
-            max_tokens=2500
-        )
+        await acquire("groq")
+        client = AsyncGroq(api_key=GROQ_API_KEY, http_client=groq_http_client())
+        chat_completion = await _request_analysis(
+            client, weather_data, geo_data, location_info, lat, lon, mode)
 
         llm_response = chat_completion.choices[0].message.content
 
         try:
             print(llm_response)
-            parsed_response = _parse_llm_response(llm_response)
-            
+            if mode == ANALYSIS_MODE_COMPACT:
+                parsed_response = json.loads(llm_response)
+            else:
+                parsed_response = _parse_llm_response(llm_response)
+
+            cache_set("analysis", cache_key, parsed_response, CACHE_TTL_ANALYSIS)
             return DisasterPrediction(
-                geographic_data=geo_data,
-                location_info=location_info,
+                geographic_data=geo_data.to_dict(),
+                location_info=location_info.to_dict(),
                 analysis=parsed_response
             )
 
@@ -58,14 +91,341 @@ async def analyze_disaster_risk_with_groq(
             print(f"JSON parsing error: {str(e)}")
             return create_fallback_prediction(weather_data, geo_data, location_info, llm_response)
 
+    except UpstreamOverloaded:
+        raise
     except Exception as e:
         print(f"Groq API error: {str(e)}")
         return create_fallback_prediction(weather_data, geo_data, location_info, f"LLM analysis failed: {str(e)}")
 
 
-def create_fallback_prediction(weather_data: Dict, geo_data: Dict, location_info: Dict, analysis: str) -> DisasterPrediction:
+async def _request_analysis(
+    client: AsyncGroq, weather_data: WeatherReport, geo_data: GeoFeatures, location_info: LocationInfo, lat: float, lon: float, mode: str
+):
+    """Send the analysis request in the given mode and return the raw chat completion"""
+    if mode == ANALYSIS_MODE_COMPACT:
+        return await client.chat.completions.create(
+            messages=[
+                {"role": "system", "content": COMPACT_SYSTEM_PROMPT},
+                {"role": "user", "content": _create_compact_prompt(
+                    weather_data, geo_data, location_info, lat, lon)}
+            ],
+            model=GROQ_MODEL,
+            temperature=GROQ_COMPACT_TEMPERATURE,
+            max_tokens=GROQ_COMPACT_MAX_TOKENS,
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "disaster_analysis", "strict": True, "schema": ANALYSIS_JSON_SCHEMA}
+            },
+            extra_body={"reasoning_effort": GROQ_REASONING_EFFORT}
+        )
+
+    structured = _get_analysis_structure()
+    prompt = _create_analysis_prompt(
+        weather_data, geo_data, location_info, lat, lon, structured)
+
+    return await client.chat.completions.create(
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        model=GROQ_MODEL,
+        temperature=0.5,
+        max_tokens=GROQ_VERBOSE_MAX_TOKENS
+    )
+
+
+def _analysis_cache_key(weather_data: WeatherReport, geo_data: GeoFeatures, lat: float, lon: float, mode: str) -> str:
+    """The analysis depends on the weather version and on the building exposure fed to the prompt"""
+    cell, _, _ = canonical_cell(lat, lon, "analysis")
+    return f"{cell}:{mode}:{weather_data.timestamp}:{exposure_digest(geo_data.building_exposure)}"
+
+
+SiteData = Tuple[WeatherReport, GeoFeatures, LocationInfo, float, float]  # weather_data, geo_data, location_info, lat, lon
+
+BULK_SYSTEM_PROMPT = (
+    COMPACT_SYSTEM_PROMPT
+    + " Several sites are given, each headed by its key in brackets; return one analysis per key."
+)
+
+
+async def analyze_disaster_risk_bulk(sites: List[SiteData]) -> List[DisasterPrediction]:
+    """
+    Analyze many locations with one Groq completion per batch of GROQ_BULK_MAX_SITES.
+
+    Predictions are returned in the order of `sites`. Cached analyses are reused, and any
+    site missing or malformed in the reply gets its own rule-based fallback prediction.
+    """
+    results: List[Optional[DisasterPrediction]] = [None] * len(sites)
+    pending = []
+    level = current_level()
+    use_llm = GROQ_API_KEY and level < LEVEL_RULE_BASED
+
+    for index, (weather_data, geo_data, location_info, lat, lon) in enumerate(sites):
+        cached = await cache_get("analysis", _analysis_cache_key(weather_data, geo_data, lat, lon, ANALYSIS_MODE_COMPACT)) \
+            if use_llm else None
+        if cached is not None:
+            results[index] = DisasterPrediction(
+                geographic_data=geo_data.to_dict(), location_info=location_info.to_dict(), analysis=cached)
+        else:
+            pending.append(index)
+
+    if pending and use_llm and level < LEVEL_CACHED_LLM:
+        batches = [pending[i:i + GROQ_BULK_MAX_SITES] for i in range(0, len(pending), GROQ_BULK_MAX_SITES)]
+        batch_results = await asyncio.gather(*(_analyze_batch([sites[i] for i in batch]) for batch in batches))
+        for batch, analyses in zip(batches, batch_results):
+            for index, analysis in zip(batch, analyses):
+                if analysis is None:
+                    continue
+                weather_data, geo_data, location_info, lat, lon = sites[index]
+                cache_set("analysis", _analysis_cache_key(weather_data, geo_data, lat, lon, ANALYSIS_MODE_COMPACT),
+                          analysis, CACHE_TTL_ANALYSIS)
+                results[index] = DisasterPrediction(
+                    geographic_data=geo_data.to_dict(), location_info=location_info.to_dict(), analysis=analysis)
+
+    for index in pending:
+        if results[index] is None:
+            weather_data, geo_data, location_info, _, _ = sites[index]
+            if not GROQ_API_KEY:
+                reason = "Groq API key not configured"
+            elif not use_llm or level >= LEVEL_CACHED_LLM:
+                reason = DEGRADED_ANALYSIS
+            else:
+                reason = "Site missing from bulk LLM response"
+            results[index] = create_fallback_prediction(weather_data, geo_data, location_info, reason)
+
+    return results
+
+
+async def _analyze_batch(sites: List[SiteData]) -> List[Optional[Dict]]:
+    """Analyze a batch of sites in one completion; None marks a site the reply did not cover"""
+    keys = [f"s{i}" for i in range(len(sites))]
+    prompt = "\n\n".join(
+        [_describe_date()] + [f"[{key}]\n{_describe_site(*site)}" for key, site in zip(keys, sites)])
+    schema = {
+        "type": "object",
+        "properties": {key: ANALYSIS_JSON_SCHEMA for key in keys},
+        "required": keys,
+        "additionalProperties": False
+    }
+
+    try:
+        await acquire("groq")
+        client = AsyncGroq(api_key=GROQ_API_KEY, http_client=groq_http_client())
+        chat_completion = await client.chat.completions.create(
+            messages=[
+                {"role": "system", "content": BULK_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            model=GROQ_MODEL,
+            temperature=GROQ_COMPACT_TEMPERATURE,
+            max_tokens=GROQ_BULK_TOKENS_PER_SITE * len(sites),
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "bulk_disaster_analysis", "strict": True, "schema": schema}
+            },
+            extra_body={"reasoning_effort": GROQ_REASONING_EFFORT}
+        )
+        parsed = json.loads(chat_completion.choices[0].message.content)
+    except UpstreamOverloaded:
+        raise
+    except Exception as e:
+        print(f"Bulk Groq analysis error: {str(e)}")
+        return [None] * len(sites)
+
+    analyses = []
+    for key in keys:
+        analysis = parsed.get(key) if isinstance(parsed, dict) else None
+        if not isinstance(analysis, dict) or any(section not in analysis for section in ANALYSIS_SECTIONS):
+            analysis = None
+        analyses.append(analysis)
+    return analyses
+
+
+ANALYSIS_SECTIONS = ("floods", "cyclone", "earthquakes", "droughts", "landslides", "conclusion")
+
+
+async def stream_disaster_analysis(
+    weather_data: WeatherReport, geo_data: GeoFeatures, location_info: LocationInfo, lat: float, lon: float
+) -> AsyncIterator[Tuple[str, Dict]]:
+    """
+    Stream the Groq analysis and yield (section, data) as soon as each top-level section closes.
+
+    Sections the LLM fails to deliver (missing key, parse error, API error) are filled in
+    from the rule-based fallback after the stream ends, so every section is always yielded once.
+    A cached analysis is replayed instead of calling the LLM; under load (see load_governor)
+    only the cache or only the rule-based analysis is used.
+    """
+    received = set()
+    failure = None
+    level = current_level()
+    cached = await cache_get("analysis", _analysis_cache_key(weather_data, geo_data, lat, lon, ANALYSIS_MODE_COMPACT)) \
+        if GROQ_API_KEY and level < LEVEL_RULE_BASED else None
+
+    if cached is not None:
+        for section in ANALYSIS_SECTIONS:
+            if section in cached:
+                received.add(section)
+                yield section, cached[section]
+    elif GROQ_API_KEY and level >= LEVEL_CACHED_LLM:
+        failure = DEGRADED_ANALYSIS
+    elif GROQ_API_KEY:
+        try:
+            await acquire("groq")
+            client = AsyncGroq(api_key=GROQ_API_KEY, http_client=groq_http_client())
+            stream = await client.chat.completions.create(
+                messages=[
+                    {"role": "system", "content": STREAMING_SYSTEM_PROMPT},
+                    {"role": "user", "content": _create_compact_prompt(
+                        weather_data, geo_data, location_info, lat, lon)}
+                ],
+                model=GROQ_MODEL,
+                temperature=GROQ_COMPACT_TEMPERATURE,
+                max_tokens=GROQ_COMPACT_MAX_TOKENS,
+                stream=True,
+                extra_body={"reasoning_effort": GROQ_REASONING_EFFORT}
+            )
+
+            parser = IncrementalSectionParser()
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                for section, data in parser.feed(delta):
+                    if section in ANALYSIS_SECTIONS and section not in received:
+                        received.add(section)
+                        yield section, data
+                if parser.done:
+                    break
+
+        except (json.JSONDecodeError, ValueError) as e:
+            print(f"Streaming JSON parsing error: {str(e)}")
+            failure = "LLM returned malformed JSON"
+        except Exception as e:
+            print(f"Groq streaming error: {str(e)}")
+            failure = f"LLM analysis failed: {str(e)}"
+    else:
+        failure = "Groq API key not configured"
+
+    if len(received) < len(ANALYSIS_SECTIONS):
+        fallback = create_fallback_prediction(
+            weather_data, geo_data, location_info, failure or "LLM response incomplete").analysis
+        for section in ANALYSIS_SECTIONS:
+            if section not in received:
+                yield section, fallback[section]
+
+
+class IncrementalSectionParser:
+    """
+    Incremental scanner for a JSON object arriving in chunks.
+
+    feed() returns the (key, value) pairs of top-level members whose values have
+    fully arrived since the previous call. Text before the object is skipped: an opening
+    brace only starts the object when the next non-whitespace character is a quote or a
+    closing brace, so braces in a preamble ("Here is the {requested} analysis") are passed
+    over, and if a member then fails to parse the scan re-syncs at the next brace.
+    """
+
+    _OBJECT_START = re.compile(r"\{\s*(?=[\"}])")
+
+    def __init__(self):
+        self.done = False
+        self._text = ""
+        self._pos = 0
+        self._start = None  # index of the opening brace, once found
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key_start = None
+        self._key = None
+        self._value_start = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        completed = []
+        self._text += chunk
+        text = self._text
+
+        i = self._pos
+        while i < len(text) and not self.done:
+            if self._start is None:
+                match = self._OBJECT_START.search(text, i)
+                if match is None:
+                    # Keep a trailing brace whose next character has not arrived yet
+                    i = text.rfind("{", i)
+                    if i == -1 or text[i + 1:].strip():
+                        i = len(text)
+                    break
+                self._start = match.start()
+                self._depth = 1
+                i = match.end()
+                continue
+
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key is None and self._key_start is not None:
+                        self._key = json.loads(text[self._key_start:i + 1])
+            elif ch == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    if self._key is None:
+                        self._key_start = i
+                    elif self._value_start is None:
+                        self._value_start = i
+            elif ch in "{[":
+                self._depth += 1
+                if self._depth == 2 and self._value_start is None:
+                    self._value_start = i
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._value_start is not None:
+                    i = self._emit(i + 1, completed)
+                    continue
+                elif self._depth == 0:
+                    if self._value_start is not None:
+                        i = self._emit(i, completed)
+                        if self._start is None:
+                            continue
+                    self.done = True
+            elif self._depth == 1:
+                if ch == ",":
+                    if self._value_start is not None:
+                        i = self._emit(i, completed)
+                        continue
+                elif ch != ":" and not ch.isspace() and self._key is not None and self._value_start is None:
+                    self._value_start = i
+            i += 1
+
+        self._pos = i
+        return completed
+
+    def _emit(self, end: int, completed: List[Tuple[str, Any]]) -> int:
+        """Append the member ending at end; returns where to continue scanning"""
+        try:
+            completed.append((self._key, json.loads(self._text[self._value_start:end])))
+        except json.JSONDecodeError:
+            # Not the object after all: look for another opening brace after this one
+            restart = self._start + 1
+            self._start = None
+            self._depth = 0
+            self._in_string = self._escape = False
+            self._key_start = self._key = self._value_start = None
+            return restart
+        self._key_start = self._key = self._value_start = None
+        return end
+
+
+def create_fallback_prediction(
+    weather_data: WeatherReport, geo_data: GeoFeatures, location_info: LocationInfo, analysis: str,
+    fallback: bool = True
+) -> DisasterPrediction:
     """
-    Create prediction using rule-based approach when LLM fails
+    Create prediction using rule-based approach when LLM fails.
+    fallback is False only when rules are the configured analysis (no Groq API key).
     """
     probability = calculate_rule_based_probability(weather_data, geo_data)
     risk_level = get_risk_level(probability)
@@ -86,10 +446,10 @@ def create_fallback_prediction(weather_data: Dict, geo_data: Dict, location_info
             "analysis": "Low cyclone risk for current location"
         },
         "earthquakes": {
-            "probability": float(geo_data["seismic_zone"] * 5),
+            "probability": float(geo_data.seismic_zone * 5),
             "risk_level": risk_level,
             "recommendations": ["Know evacuation routes", "Secure heavy objects"],
-            "analysis": f"Earthquake risk based on seismic zone {geo_data['seismic_zone']}"
+            "analysis": f"Earthquake risk based on seismic zone {geo_data.seismic_zone}"
         },
         "droughts": {
             "probability": 10.0,
@@ -98,10 +458,10 @@ def create_fallback_prediction(weather_data: Dict, geo_data: Dict, location_info
             "analysis": "Low drought risk based on current weather"
         },
         "landslides": {
-            "probability": 25.0 if geo_data["terrain"] in ["mountain", "high_mountain"] else 5.0,
-            "risk_level": "Medium" if geo_data["terrain"] in ["mountain", "high_mountain"] else "Low",
+            "probability": 25.0 if geo_data.terrain.mountainous else 5.0,
+            "risk_level": "Medium" if geo_data.terrain.mountainous else "Low",
             "recommendations": ["Avoid steep slopes during heavy rain", "Monitor soil conditions"],
-            "analysis": f"Landslide risk assessment for {geo_data['terrain']} terrain"
+            "analysis": f"Landslide risk assessment for {geo_data.terrain.label} terrain"
         },
         "conclusion": {
             "probability": probability,
@@ -112,11 +472,36 @@ def create_fallback_prediction(weather_data: Dict, geo_data: Dict, location_info
         }
     }
 
+    _add_exposure_notes(fallback_analysis, geo_data)
+
     return DisasterPrediction(
-        geographic_data=geo_data,
-        location_info=location_info,
-        analysis=fallback_analysis
+        geographic_data=geo_data.to_dict(),
+        location_info=location_info.to_dict(),
+        analysis=fallback_analysis,
+        fallback=fallback
+    )
+
+
+def _add_exposure_notes(analysis: Dict, geo_data: GeoFeatures):
+    """Extend the rule-based earthquake and flood sections with the local building exposure"""
+    exposure = geo_data.building_exposure
+    if not exposure or not exposure["buildings"]:
+        return
+
+    earthquakes = analysis["earthquakes"]
+    earthquakes["analysis"] += (
+        f"; {exposure['tall_buildings']} of {exposure['buildings']} mapped buildings nearby are "
+        f"{EXPOSURE_TALL_HEIGHT_M:.0f} m or taller"
     )
+    if exposure["tall_buildings"] and geo_data.seismic_zone >= 3:
+        earthquakes["recommendations"].append(
+            "During shaking keep clear of tall buildings' facades and glass; gather in open ground")
+
+    floods = analysis["floods"]
+    floods["analysis"] += f"; built-up density {exposure['built_up_density'] * 100:.1f}% within {exposure['radius_meters']} m"
+    if exposure["built_up_density"] >= 0.3:
+        floods["recommendations"].append(
+            "Dense built-up area drains poorly: expect fast street flooding in heavy rain")
 
 
 def _get_analysis_structure() -> str:
@@ -177,12 +562,13 @@ def _get_analysis_structure() -> str:
         """
 
 
-def _create_analysis_prompt(weather_data: Dict, geo_data: Dict, location_info: Dict, lat: float, lon: float, structured: str) -> str:
+def _create_analysis_prompt(weather_data: WeatherReport, geo_data: GeoFeatures, location_info: LocationInfo, lat: float, lon: float, structured: str) -> str:
     """Create the analysis prompt for LLM"""
     current_time = datetime.now()
+    current = weather_data.observation
 
     return f"""
-    Analyze natural disaster risk for location: {location_info['city']}, {location_info['state']}, India
+    Analyze natural disaster risk for location: {location_info.city}, {location_info.state}, India
     Coordinates: {lat}, {lon}
 
     
@@ -192,20 +578,24 @@ def _create_analysis_prompt(weather_data: Dict, geo_data: Dict, location_info: D
     Season: {_get_season(current_time.month)}
 
     WEATHER DATA:
-    Current Temperature: {weather_data['current'].get('main', {}).get('temp', 'N/A')}°C
-    Weather: {weather_data['current'].get('weather', [{}])[0].get('description', 'N/A')}
-    Wind Speed: {weather_data['current'].get('wind', {}).get('speed', 'N/A')} m/s
-    Humidity: {weather_data['current'].get('main', {}).get('humidity', 'N/A')}%
-    Pressure: {weather_data['current'].get('main', {}).get('pressure', 'N/A')} hPa
-    Rainfall: {weather_data['current'].get('rain', {}).get('1h', 0)} mm/h
+    Current Temperature: {current.temp}°C
+    Weather: {current.description}
+    Wind Speed: {current.wind_speed} m/s
+    Humidity: {_humidity(current)}%
+    Pressure: {current.pressure} hPa
+    Rainfall: {current.rain_1h} mm/h
+
+    FORECAST (next 5 days):
+    {_describe_forecast(weather_data) or 'Not available'}
 
     GEOGRAPHIC DATA:
-    Elevation: {geo_data['elevation']} meters
-    Terrain: {geo_data['terrain']}
-    Seismic Zone: {geo_data['seismic_zone']} (1-5 scale)
-    Climate Zone: {geo_data['climate_zone']}
+    Elevation: {geo_data.elevation} meters
+    Terrain: {geo_data.terrain.label}
+    Seismic Zone: {geo_data.seismic_zone} (1-5 scale)
+    Climate Zone: {geo_data.climate_zone.label}
+    Building Exposure: {_describe_exposure(geo_data).strip() or 'Not available'}
 
-    LOCATION: {location_info['city']}, {location_info['district']}, {location_info['state']}
+    LOCATION: {location_info.city}, {location_info.district}, {location_info.state}
 
     Based on this data, provide a JSON response with:
     {structured}
@@ -235,6 +625,91 @@ def _create_analysis_prompt(weather_data: Dict, geo_data: Dict, location_info: D
     """
 
 
+def _create_compact_prompt(weather_data: WeatherReport, geo_data: GeoFeatures, location_info: LocationInfo, lat: float, lon: float) -> str:
+    """Create the minimal prompt for structured-output analysis.
+
+    Only the date (not the time) is included so identical inputs produce identical prompts.
+    """
+    return f"{_describe_date()}\n{_describe_site(weather_data, geo_data, location_info, lat, lon)}"
+
+
+def _describe_date() -> str:
+    today = datetime.now()
+    return f"Date: {today.strftime('%Y-%m-%d')} ({_get_season(today.month)})"
+
+
+def _describe_site(weather_data: WeatherReport, geo_data: GeoFeatures, location_info: LocationInfo, lat: float, lon: float) -> str:
+    """Compact location, weather and geography lines for one site"""
+    current = weather_data.observation
+
+    return (
+        f"Location: {location_info.city}, {location_info.district}, {location_info.state}, India ({lat:.4f}, {lon:.4f})\n"
+        f"Weather: {current.temp}°C, {current.description}, "
+        f"wind {current.wind_speed} m/s, humidity {_humidity(current)}%, "
+        f"pressure {current.pressure} hPa, rain {current.rain_1h} mm/h\n"
+        f"{_describe_forecast(weather_data)}"
+        f"Geography: elevation {geo_data.elevation} m, terrain {geo_data.terrain.label}, "
+        f"seismic zone {geo_data.seismic_zone}/5, climate {geo_data.climate_zone.label}"
+        f"{_describe_exposure(geo_data)}"
+    )
+
+
+def _humidity(current: WeatherObservation) -> str:
+    return "N/A" if current.humidity is None else str(current.humidity)
+
+
+def _describe_forecast(weather_data: WeatherReport) -> str:
+    """One forecast line for the compact prompt, or nothing when no forecast is available"""
+    features = weather_data.features
+    if not features.available:
+        return ""
+    return (
+        f"5-day forecast: max 24h rain {features.max_rain_24h} mm, max 72h rain {features.max_rain_72h} mm, "
+        f"peak wind {features.peak_wind} m/s, steepest pressure fall {features.max_pressure_drop_3h} hPa/3h, "
+        f"min pressure {features.min_pressure} hPa, max temp {features.max_temp}°C\n"
+    )
+
+
+def _describe_exposure(geo_data: GeoFeatures) -> str:
+    """Building exposure line for the earthquake and flood assessment, or nothing when unknown"""
+    exposure = geo_data.building_exposure
+    if not exposure or not exposure["buildings"]:
+        return ""
+    return (
+        f"\nBuildings with mapped height within {exposure['radius_meters']} m: {exposure['buildings']}, "
+        f"{exposure['tall_buildings']} of them {EXPOSURE_TALL_HEIGHT_M:.0f} m or taller, median height "
+        f"{exposure['height_median_m']} m, max {exposure['height_max_m']} m, "
+        f"built-up density {exposure['built_up_density'] * 100:.1f}% (consider for earthquakes and floods)"
+    )
+
+
+def _build_analysis_json_schema() -> Dict[str, Any]:
+    """Derive a strict, fully inlined JSON schema from the DisasterAnalysis model"""
+    schema = DisasterAnalysis.model_json_schema()
+    definitions = schema.pop("$defs", {})
+
+    def inline(node):
+        if isinstance(node, dict):
+            if "$ref" in node:
+                return inline(definitions[node["$ref"].rsplit("/", 1)[-1]])
+            return {key: inline(value) for key, value in node.items() if key not in ("title", "description")}
+        if isinstance(node, list):
+            return [inline(item) for item in node]
+        return node
+
+    return inline(schema)
+
+
+ANALYSIS_JSON_SCHEMA = _build_analysis_json_schema()
+
+# Groq does not support response_format together with streaming, so the schema goes in the prompt
+STREAMING_SYSTEM_PROMPT = (
+    COMPACT_SYSTEM_PROMPT
+    + " Emit the keys in this order: floods, cyclone, earthquakes, droughts, landslides, conclusion. Schema: "
+    + json.dumps(ANALYSIS_JSON_SCHEMA, separators=(",", ":"))
+)
+
+
 def _get_season(month: int) -> str:
     """Get season based on month (for India)"""
     if month in [12, 1, 2]:
@@ -0,0 +1,66 @@
+import hashlib
+import numpy as np
+import orjson
+from typing import Dict, Any, Optional
+from config import EXPOSURE_TALL_HEIGHT_M, CACHE_TTL_EXPOSURE
+from cache_store import cache_get, cache_set
+from overpass_parser import BuildingArrays
+from records import GeoFeatures
+from utils import calculate_haversine_distance_array, canonical_cell
+
+
+def compute_exposure(buildings: BuildingArrays, lat: float, lon: float, radius: float) -> Dict[str, Any]:
+    """
+    Building exposure within radius metres of a point, in one vectorized pass over the
+    footprint arrays: count, footprint area, built-up density (share of the circle covered
+    by footprints), height distribution and the number of tall buildings.
+    Only buildings with a mapped height are included, as that is what the Overpass query returns.
+    """
+    inside = calculate_haversine_distance_array(lat, lon, buildings.lat, buildings.lon) * 1000.0 <= radius
+    area = buildings.area[inside]
+    height = buildings.height[inside]
+    height = height[~np.isnan(height)]
+
+    footprint = float(area.sum())
+    median, p90 = np.percentile(height, [50, 90]) if len(height) else (0.0, 0.0)
+    return {
+        "radius_meters": radius,
+        "buildings": int(inside.sum()),
+        "footprint_area_m2": round(footprint, 1),
+        "mean_footprint_m2": round(footprint / len(area), 1) if len(area) else 0.0,
+        "built_up_density": round(footprint / (np.pi * radius ** 2), 4),
+        "height_median_m": round(float(median), 1),
+        "height_p90_m": round(float(p90), 1),
+        "height_max_m": round(float(height.max()), 1) if len(height) else 0.0,
+        "tall_buildings": int((height >= EXPOSURE_TALL_HEIGHT_M).sum())
+    }
+
+
+def exposure_digest(exposure: Optional[Dict[str, Any]]) -> str:
+    """Short digest of an exposure summary (or "none") for cache keys and ETags"""
+    if exposure is None:
+        return "none"
+    return hashlib.sha1(orjson.dumps(exposure, option=orjson.OPT_SORT_KEYS)).hexdigest()[:12]
+
+
+def store_exposure(lat: float, lon: float, exposure: Dict[str, Any]):
+    cell, _, _ = canonical_cell(lat, lon, "exposure")
+    cache_set("exposure", cell, exposure, CACHE_TTL_EXPOSURE)
+
+
+async def cached_exposure(lat: float, lon: float) -> Optional[Dict[str, Any]]:
+    """The building exposure within EXPOSURE_RADIUS_M last computed for this cell by /buildings-emergency, if any"""
+    cell, _, _ = canonical_cell(lat, lon, "exposure")
+    return await cache_get("exposure", cell)
+
+
+async def with_exposure(geo_data: GeoFeatures, lat: float, lon: float) -> GeoFeatures:
+    """
+    geo_data plus the building exposure within EXPOSURE_RADIUS_M last computed for this cell
+    by /buildings-emergency, if any. Exposure is never fetched here: Overpass is far too slow and rate-limited to
+    query on every prediction.
+    """
+    exposure = await cached_exposure(lat, lon)
+    if exposure is None:
+        return geo_data
+    return geo_data.with_exposure(exposure)
@@ -0,0 +1,419 @@
+import asyncio
+import json
+import math
+import numpy as np
+import orjson
+from typing import Dict, Any, List, Optional, Tuple
+from groq import AsyncGroq
+from config import (
+    GROQ_API_KEY, GROQ_MODEL, GROQ_COMPACT_TEMPERATURE, GROQ_REASONING_EFFORT,
+    OVERPASS_URL, OVERPASS_TILE_SIZE_M, OVERPASS_MAX_SUB_BOXES, OVERPASS_MAX_CONCURRENT, OVERPASS_MAX_FETCH_SECONDS,
+    OVERPASS_PARSE_CHUNK_BYTES,
+    FACILITY_DISTANCE_SCALE_KM, FACILITY_ELEVATION_SCALE_M, FACILITY_TIE_MARGIN,
+    FACILITY_LLM_CANDIDATES, FACILITY_MAX_TOKENS, CACHE_TTL_FACILITY, EXPOSURE_RADIUS_M
+)
+from cache_store import cache_get, cache_set
+from rate_limiter import acquire, pace, seconds_for, UpstreamOverloaded
+from traffic_capture import create_http_client, groq_http_client
+from geographic_service import get_elevations
+from cpu_pool import run_cpu_bound
+from overpass_parser import ParsedOverpass, BuildingArrays, OverpassElementStream, parse_overpass_chunk
+from exposure_service import compute_exposure, store_exposure
+from load_governor import current_level, LEVEL_CACHED_LLM, LEVEL_RULE_BASED
+from utils import calculate_haversine_distance_array, canonical_cell
+
+FACILITY_TYPES = ("hospital", "clinic", "pharmacy", "emergency")
+DISASTER_TYPES = ("floods", "cyclone", "earthquakes", "droughts", "landslides")
+
+# Capability of each facility type (rows, FACILITY_TYPES order, then unknown types) for each
+# disaster (columns, DISASTER_TYPES order)
+FACILITY_CAPABILITY = np.array([
+    # floods cyclone earthquakes droughts landslides
+    [1.00, 1.00, 1.00, 0.90, 1.00],  # hospital
+    [0.55, 0.55, 0.50, 0.70, 0.50],  # clinic
+    [0.20, 0.20, 0.15, 0.45, 0.15],  # pharmacy
+    [0.90, 0.90, 0.95, 0.60, 0.95],  # emergency
+    [0.30, 0.30, 0.30, 0.30, 0.30],  # other
+])
+
+# Flood exposure assumed per disaster when the caller gives no flood probability
+DEFAULT_FLOOD_RISK = {"floods": 1.0, "cyclone": 0.6, "earthquakes": 0.0, "droughts": 0.0, "landslides": 0.0}
+
+# Score weights; the elevation term is in [-1, 1] so scores stay within 0-100
+WEIGHT_CAPABILITY = 50.0
+WEIGHT_PROXIMITY = 35.0
+WEIGHT_ELEVATION = 15.0
+
+FACILITY_SYSTEM_PROMPT = (
+    "You are an emergency response coordinator in India. Several facilities scored almost equally "
+    "for the given disaster; pick the one best suited for immediate assistance, using the facility "
+    "names to infer specialisation and capacity. Reply only with JSON matching the given schema; "
+    "keep the reasoning under 40 words."
+)
+
+
+class OverpassError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def bounding_box(lat: float, lon: float, radius: float) -> Dict[str, float]:
+    lat_offset = radius / 111320.0  # Approximate meters per degree latitude
+    lon_offset = radius / (111320.0 * math.cos(math.radians(lat)))
+    return {
+        "south": lat - lat_offset,
+        "north": lat + lat_offset,
+        "west": lon - lon_offset,
+        "east": lon + lon_offset
+    }
+
+
+OVERPASS_QUERY = """
+[out:json][timeout:60];
+(
+  // General buildings with height
+  way["building"]["height"]({bbox});
+  relation["building"]["height"]({bbox});
+
+  // Emergency/medical buildings
+  way["amenity"~"hospital|clinic|doctors|pharmacy|emergency"]({bbox});
+  node["amenity"~"hospital|clinic|doctors|pharmacy|emergency"]({bbox});
+  relation["amenity"~"hospital|clinic|doctors|pharmacy|emergency"]({bbox});
+);
+out body geom;
+>;
+out skel qt;
+"""
+
+# Overpass grants each client a couple of concurrent slots; shared by all requests in the worker
+_overpass_slots = asyncio.Semaphore(OVERPASS_MAX_CONCURRENT)
+
+
+def split_bounding_box(box: Dict[str, float], tile_m: float, max_boxes: int) -> List[Dict[str, float]]:
+    """
+    Split a bounding box into a grid of sub-boxes no larger than tile_m on a side, or into
+    at most max_boxes larger ones when that would take more
+    """
+    mid_lat = math.radians((box["south"] + box["north"]) / 2)
+    # Rounded so a box of exactly two tiles is not split into three
+    rows = max(1, math.ceil(round((box["north"] - box["south"]) * 111320.0 / tile_m, 6)))
+    cols = max(1, math.ceil(round((box["east"] - box["west"]) * 111320.0 * math.cos(mid_lat) / tile_m, 6)))
+    while rows * cols > max_boxes:
+        if rows >= cols:
+            rows -= 1
+        else:
+            cols -= 1
+    lat_edges = np.linspace(box["south"], box["north"], rows + 1)
+    lon_edges = np.linspace(box["west"], box["east"], cols + 1)
+    return [
+        {"south": float(lat_edges[r]), "north": float(lat_edges[r + 1]),
+         "west": float(lon_edges[c]), "east": float(lon_edges[c + 1])}
+        for r in range(rows) for c in range(cols)
+    ]
+
+
+class OverpassArea:
+    """Merged result of the Overpass sub-box queries for one area"""
+
+    __slots__ = ("query_info", "coverage", "header", "elements_json", "element_count", "facilities", "exposure")
+
+    def __init__(self, query_info: Dict[str, Any], coverage: Dict[str, Any], header: Dict[str, Any],
+                 elements_json: bytes, element_count: int, facilities: List[Dict[str, Any]],
+                 exposure: Dict[str, Any]):
+        self.query_info = query_info
+        self.coverage = coverage
+        self.header = header
+        self.elements_json = elements_json  # JSON array of the merged elements
+        self.element_count = element_count
+        self.facilities = facilities
+        self.exposure = exposure
+
+    def to_json(self) -> bytes:
+        """The /buildings-emergency response body; elements are spliced in without re-encoding"""
+        header = orjson.dumps(self.header)[:-1] + (b"," if self.header else b"")
+        return (
+            b'{"query_info":' + orjson.dumps(self.query_info)
+            + b',"coverage":' + orjson.dumps(self.coverage)
+            + b',"building_exposure":' + orjson.dumps(self.exposure)
+            + b',"data":' + header + b'"elements":' + self.elements_json + b"}}"
+        )
+
+
+def merge_parsed(parts: List[ParsedOverpass]) -> Tuple[bytes, int, List[Dict[str, Any]]]:
+    """
+    Merge the parsed chunks of the sub-box responses, keeping one copy of each element by OSM
+    type and id and preferring a tagged copy over a skeleton one (from "out skel"). Elements
+    keep their arrival order.
+    Returns (JSON array of elements, element count, facilities).
+    """
+    types = np.concatenate([p.types for p in parts])
+    ids = np.concatenate([p.ids for p in parts])
+    tagged = np.concatenate([p.tagged for p in parts])
+    part = np.concatenate([np.full(len(p.ids), i) for i, p in enumerate(parts)])
+    index = np.concatenate([np.arange(len(p.ids)) for p in parts])
+
+    order = np.lexsort((~tagged, ids, types))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (types[order][1:] != types[order][:-1]) | (ids[order][1:] != ids[order][:-1])
+    keep = np.sort(order[first])
+
+    elements_json = b"[" + b",".join([parts[part[k]].element(index[k]) for k in keep]) + b"]"
+    facilities = list({f["id"]: f for p in parts for f in p.facilities}.values())
+    return elements_json, len(keep), facilities
+
+
+async def _fetch_sub_box(client, box: Dict[str, float], lat: float, lon: float) -> List[ParsedOverpass]:
+    """
+    Fetch one sub-box, parsing the response as it arrives; returns the parsed chunks, the last
+    of which carries the response header. Raises OverpassError or UpstreamOverloaded on failure.
+    """
+    bbox = f"{box['south']},{box['west']},{box['north']},{box['east']}"
+    stream = OverpassElementStream()
+    chunks = []
+    async with _overpass_slots:
+        # Wait for the token while holding the slot, so later sub-boxes queue here and not in the limiter
+        await pace("overpass", 1)
+        await acquire("overpass")
+        async with client.stream(
+            "POST",
+            OVERPASS_URL,
+            data=OVERPASS_QUERY.format(bbox=bbox),
+            headers={"Content-Type": "application/x-www-form-urlencoded"}
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise OverpassError(response.status_code, f"Overpass API request failed: {response.text[:500]}")
+
+            pending = bytearray()
+            async for data in response.aiter_bytes():
+                pending.extend(data)
+                if len(pending) >= OVERPASS_PARSE_CHUNK_BYTES:
+                    stream, parsed = await run_cpu_bound(
+                        parse_overpass_chunk, stream, bytes(pending), False, lat, lon, payload_size=len(pending))
+                    chunks.append(parsed)
+                    pending.clear()
+    stream, parsed = await run_cpu_bound(
+        parse_overpass_chunk, stream, bytes(pending), True, lat, lon, payload_size=len(pending))
+    chunks.append(parsed)
+    if parsed.remark:
+        raise OverpassError(504, f"Overpass API reported: {parsed.remark}")
+    return chunks
+
+
+async def fetch_buildings_and_facilities(lat: float, lon: float, radius: int) -> OverpassArea:
+    """
+    Buildings with height data and emergency facilities within radius metres, as returned by
+    the Overpass API, together with the query metadata.
+
+    Areas wider than OVERPASS_TILE_SIZE_M (radii above 5 km) are split into up to
+    OVERPASS_MAX_SUB_BOXES sub-boxes fetched concurrently (at most OVERPASS_MAX_CONCURRENT at
+    a time). Every sub-box is a separate Overpass query and takes its own rate-limit token;
+    UpstreamOverloaded is raised up front if they need more than OVERPASS_MAX_FETCH_SECONDS
+    of the quota.
+    Each response is parsed as it streams in, OVERPASS_PARSE_CHUNK_BYTES at a time in the
+    process pool, so only the compact parsed elements are held, and the results are merged
+    by OSM id. Building exposure is computed from the footprints within
+    radius for the response, and within EXPOSURE_RADIUS_M for predictions in the same cell
+    when the query covered that circle completely. If some sub-boxes fail the rest is returned and "coverage"
+    lists the failed ones; OverpassError is raised only if every sub-box fails.
+    """
+    box = bounding_box(lat, lon, radius)
+    sub_boxes = split_bounding_box(box, OVERPASS_TILE_SIZE_M, OVERPASS_MAX_SUB_BOXES)
+    needed = seconds_for("overpass", len(sub_boxes))
+    if needed > OVERPASS_MAX_FETCH_SECONDS:
+        raise UpstreamOverloaded("overpass", f"{len(sub_boxes)} sub-box queries need about {needed:.0f}s of quota")
+
+    async with create_http_client(timeout=120.0) as client:
+        results = await asyncio.gather(
+            *(_fetch_sub_box(client, sub_box, lat, lon) for sub_box in sub_boxes), return_exceptions=True)
+
+    fetched = [r for r in results if isinstance(r, list)]
+    failed = [
+        {"bounding_box": sub_box, "error": str(r)}
+        for sub_box, r in zip(sub_boxes, results) if not isinstance(r, list)
+    ]
+    if not fetched:
+        error = results[0]
+        if isinstance(error, (OverpassError, UpstreamOverloaded)):
+            raise error
+        raise OverpassError(502, f"Overpass API request failed: {error}")
+    for entry in failed:
+        print(f"Overpass sub-box failed: {entry['error']}")
+
+    # Sub-boxes may be answered from different database states; report the oldest
+    headers = [chunks[-1].header for chunks in fetched]
+    header = dict(headers[0])
+    header["osm3s"] = dict(header.get("osm3s", {}))
+    header["osm3s"]["timestamp_osm_base"] = min(
+        (h.get("osm3s", {}).get("timestamp_osm_base", "") for h in headers), default="")
+
+    parts = [chunk for chunks in fetched for chunk in chunks]
+    elements_json, element_count, facilities = merge_parsed(parts)
+    buildings = BuildingArrays.concatenate([p.buildings for p in parts])
+    exposure = compute_exposure(buildings, lat, lon, radius)
+    if radius >= EXPOSURE_RADIUS_M and not failed:
+        store_exposure(lat, lon, compute_exposure(buildings, lat, lon, EXPOSURE_RADIUS_M))
+    return OverpassArea(
+        query_info={
+            "center": {"latitude": lat, "longitude": lon},
+            "radius_meters": radius,
+            "bounding_box": box
+        },
+        coverage={
+            "complete": not failed,
+            "sub_boxes": len(sub_boxes),
+            "covered_fraction": round(len(fetched) / len(sub_boxes), 3),
+            "failed": failed
+        },
+        header=header,
+        elements_json=elements_json,
+        element_count=element_count,
+        facilities=facilities,
+        exposure=exposure
+    )
+
+
+def score_facilities(
+    types: np.ndarray, distances_km: np.ndarray, elevation_gain_m: np.ndarray,
+    disaster_type: str, flood_risk: float
+) -> np.ndarray:
+    """
+    Score facilities 0-100 for a disaster in one vectorized pass: type capability for the
+    disaster, proximity, and, weighted by flood risk, elevation above the incident site.
+    """
+    rows = np.full(len(types), len(FACILITY_TYPES))
+    for row, facility_type in enumerate(FACILITY_TYPES):
+        rows[types == facility_type] = row
+    capability = FACILITY_CAPABILITY[rows, DISASTER_TYPES.index(disaster_type)]
+
+    proximity = np.exp(-distances_km / FACILITY_DISTANCE_SCALE_KM)
+    elevation = np.clip(elevation_gain_m / FACILITY_ELEVATION_SCALE_M, -1.0, 1.0) * flood_risk
+    return WEIGHT_CAPABILITY * capability + WEIGHT_PROXIMITY * proximity + WEIGHT_ELEVATION * elevation
+
+
+def get_priority(score: float) -> str:
+    if score >= 80:
+        return "highest"
+    elif score >= 60:
+        return "high"
+    elif score >= 40:
+        return "medium"
+    else:
+        return "low"
+
+
+async def select_facility(
+    lat: float, lon: float, disaster_type: str, facilities: List[Dict[str, Any]],
+    flood_probability: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Pick the best facility for a disaster. Candidates are ranked with score_facilities from
+    the requested point; the LLM is only asked when several candidates are within
+    FACILITY_TIE_MARGIN of the best. Tie-break decisions are cached per "facility" cell and
+    disaster type, and reused only while the cached choice is still a contender here.
+    """
+    cell, _, _ = canonical_cell(lat, lon, "facility")
+    if not facilities:
+        return {"cell": cell, "disaster_type": disaster_type, "selected": None, "candidates": [],
+                "method": "none", "reasoning": "No emergency facilities found nearby"}
+
+    lats = np.array([f["latitude"] for f in facilities], dtype=float)
+    lons = np.array([f["longitude"] for f in facilities], dtype=float)
+    types = np.array([f["type"] for f in facilities])
+
+    elevations = await get_elevations(np.append(lats, lat), np.append(lons, lon))
+    distances_km = calculate_haversine_distance_array(lat, lon, lats, lons)
+    flood_risk = DEFAULT_FLOOD_RISK[disaster_type] if flood_probability is None \
+        else min(max(flood_probability, 0.0), 100.0) / 100.0
+    scores = score_facilities(types, distances_km, elevations[:-1] - elevations[-1], disaster_type, flood_risk)
+
+    order = np.argsort(-scores, kind="stable")
+    ranked = [{
+        **facilities[i],
+        "score": round(float(scores[i]), 1),
+        "distance_km": round(float(distances_km[i]), 3),
+        "elevation": float(elevations[i])
+    } for i in order[:FACILITY_LLM_CANDIDATES]]
+
+    contenders = [c for c in ranked if c["score"] >= ranked[0]["score"] - FACILITY_TIE_MARGIN]
+    cache_key = f"{cell}:{disaster_type}"
+    method = "score"
+    reasoning = None
+    selected = ranked[0]
+
+    level = current_level()
+    cached = await cache_get("facility", cache_key) if level < LEVEL_RULE_BASED else None
+    by_id = {c["id"]: c for c in contenders}
+    if cached is not None and cached["facility_id"] in by_id:
+        selected = by_id[cached["facility_id"]]
+        reasoning = cached["reasoning"]
+        method = "cached"
+    elif len(contenders) > 1 and GROQ_API_KEY and level < LEVEL_CACHED_LLM:
+        choice = await _break_tie(disaster_type, contenders)
+        if choice is not None and choice["facility_id"] in by_id:
+            selected = by_id[choice["facility_id"]]
+            reasoning = choice["reasoning"]
+            method = "llm"
+            cache_set("facility", cache_key, choice, CACHE_TTL_FACILITY)
+
+    if reasoning is None:
+        reasoning = (
+            f"{selected['name']} ({selected['type']}) has the highest score for {disaster_type}: "
+            f"{selected['distance_km']:.2f} km away, {selected['elevation'] - float(elevations[-1]):+.0f} m "
+            f"relative to the site"
+        )
+
+    return {
+        "cell": cell,
+        "disaster_type": disaster_type,
+        "selected": selected,
+        "score": selected["score"],
+        "priority": get_priority(selected["score"]),
+        "reasoning": reasoning,
+        "method": method,
+        "candidates": ranked
+    }
+
+
+async def _break_tie(disaster_type: str, contenders: List[Dict[str, Any]]) -> Optional[Dict[str, str]]:
+    """Ask the LLM to choose among near-equal candidates; None if it fails"""
+    ids = [c["id"] for c in contenders]
+    prompt = f"Disaster: {disaster_type}\nCandidates:\n" + "\n".join(
+        f"- {c['id']}: {c['name']} ({c['type']}), {c['distance_km']:.2f} km, elevation {c['elevation']:.0f} m, "
+        f"score {c['score']}"
+        for c in contenders)
+    schema = {
+        "type": "object",
+        "properties": {
+            "facility_id": {"type": "string", "enum": ids},
+            "reasoning": {"type": "string"}
+        },
+        "required": ["facility_id", "reasoning"],
+        "additionalProperties": False
+    }
+
+    try:
+        await acquire("groq")
+        client = AsyncGroq(api_key=GROQ_API_KEY, http_client=groq_http_client())
+        chat_completion = await client.chat.completions.create(
+            messages=[
+                {"role": "system", "content": FACILITY_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            model=GROQ_MODEL,
+            temperature=GROQ_COMPACT_TEMPERATURE,
+            max_tokens=FACILITY_MAX_TOKENS,
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "facility_choice", "strict": True, "schema": schema}
+            },
+            extra_body={"reasoning_effort": GROQ_REASONING_EFFORT}
+        )
+        return json.loads(chat_completion.choices[0].message.content)
+    except UpstreamOverloaded:
+        raise
+    except Exception as e:
+        print(f"Facility tie-break error: {str(e)}")
+        return None
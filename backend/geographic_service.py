@@ -1,37 +1,47 @@
-import httpx
+import asyncio
 import math
-from typing import Dict, Any
+import numpy as np
 from config import (
     ELEVATION_API_URL, REVERSE_GEOCODING_URL, NOMINATIM_URL, 
-    COASTAL_REFERENCE_POINTS
+    COASTAL_REFERENCE_POINTS, CACHE_TTL_GEOGRAPHIC, CACHE_TTL_LOCATION, ELEVATION_BATCH_SIZE
 )
-from utils import calculate_haversine_distance
+from cache_store import cache_get, cache_set
+from traffic_capture import create_http_client
+from rate_limiter import acquire, UpstreamOverloaded
+from utils import calculate_haversine_distance, canonical_cell, encode_cells, decode_cells
+from config import CELL_PRECISION
+from records import GeoFeatures, LocationInfo, Terrain, ClimateZone
 
 
-async def get_geographic_data(lat: float, lon: float) -> Dict[str, Any]:
+async def get_geographic_data(lat: float, lon: float) -> GeoFeatures:
     """
     Get geographic data from multiple free APIs
     """
-    async with httpx.AsyncClient() as client:
+    cache_key, lat, lon = canonical_cell(lat, lon, "geo")
+    cached = await cache_get("geo", cache_key, GeoFeatures.from_dict)
+    if cached is not None:
+        return cached
+
+    async with create_http_client() as client:
         try:
             elevation_url = f"{ELEVATION_API_URL}?latitude={lat}&longitude={lon}"
             elevation_response = await client.get(elevation_url, timeout=10.0)
-            elevation_data = elevation_response.json()
-
-            elevation = elevation_data.get("elevation", [200])[
-                0] if elevation_data.get("elevation") else 200
-
-            geographic_features = {
-                "elevation": elevation,
-                "terrain": await classify_terrain(elevation, lat, lon),
-                "seismic_zone": get_seismic_zone(lat, lon),
-                "climate_zone": get_climate_zone(lat, lon),
-                "raw_data": {
-                    "elevation": elevation_data,
-                    "source": "open-meteo"
-                }
-            }
-
+            elevation_response.raise_for_status()
+            elevations = elevation_response.json().get("elevation")
+            if not elevations or elevations[0] is None:
+                # The 200 m default belongs to the fallback, which is not cached
+                raise ValueError("no elevation in response")
+            elevation = elevations[0]
+
+            geographic_features = GeoFeatures(
+                elevation,
+                await classify_terrain(elevation, lat, lon),
+                get_seismic_zone(lat, lon),
+                get_climate_zone(lat, lon),
+                "open-meteo"
+            )
+
+            cache_set("geo", cache_key, geographic_features, CACHE_TTL_GEOGRAPHIC)
             return geographic_features
 
         except Exception as e:
@@ -39,53 +49,95 @@ async def get_geographic_data(lat: float, lon: float) -> Dict[str, Any]:
             return await get_fallback_geographic_data(lat, lon)
 
 
-async def get_location_info(lat: float, lon: float) -> Dict[str, Any]:
+async def get_location_info(lat: float, lon: float) -> LocationInfo:
     """
     Get detailed location information from free APIs
     """
-    async with httpx.AsyncClient() as client:
+    cache_key, lat, lon = canonical_cell(lat, lon, "location")
+    cached = await cache_get("location", cache_key, LocationInfo.from_dict)
+    if cached is not None:
+        return cached
+
+    async with create_http_client() as client:
         try:
             url = f"{REVERSE_GEOCODING_URL}?latitude={lat}&longitude={lon}&localityLanguage=en"
             response = await client.get(url, timeout=10.0)
+            response.raise_for_status()
             data = response.json()
-
-            return {
-                "city": data.get("city", "Unknown"),
-                "state": data.get("principalSubdivision", "Unknown"),
-                "district": data.get("localityInfo", {}).get("administrative", [{}])[0].get("name", "Unknown"),
-                "country": data.get("countryName", "India"),
-                "postal_code": data.get("postcode", ""),
-                "locality": data.get("locality", ""),
-                "raw_data": data
-            }
+            if "countryName" not in data:
+                # An error body would otherwise be cached as "Unknown" for CACHE_TTL_LOCATION
+                raise ValueError("not a reverse-geocoding response")
+            location_info = LocationInfo.from_bigdatacloud(data)
+            cache_set("location", cache_key, location_info, CACHE_TTL_LOCATION)
+            return location_info
         except Exception as e:
             print(f"Location API error: {str(e)}")
-            return {
-                "city": "Unknown",
-                "state": "Unknown",
-                "district": "Unknown",
-                "country": "India",
-                "postal_code": "",
-                "locality": ""
-            }
+            return LocationInfo()
 
 
-async def classify_terrain(elevation: float, lat: float, lon: float) -> str:
+async def classify_terrain(elevation: float, lat: float, lon: float) -> Terrain:
     """
     Classify terrain based on elevation and location
     """
     if elevation > 2500:
-        return "high_mountain"
+        return Terrain.HIGH_MOUNTAIN
     elif elevation > 1000:
-        return "mountain"
+        return Terrain.MOUNTAIN
     elif elevation > 500:
-        return "hill"
+        return Terrain.HILL
     elif elevation < 10:
-        return "coastal_plain"
+        return Terrain.COASTAL_PLAIN
     elif elevation < 200:
-        return "plain"
+        return Terrain.PLAIN
     else:
-        return "plateau"
+        return Terrain.PLATEAU
+
+
+def classify_terrain_array(elevations: np.ndarray) -> np.ndarray:
+    """Vectorized classify_terrain, as uint8 Terrain codes"""
+    return np.select(
+        [elevations > 2500, elevations > 1000, elevations > 500, elevations < 10, elevations < 200],
+        [Terrain.HIGH_MOUNTAIN, Terrain.MOUNTAIN, Terrain.HILL, Terrain.COASTAL_PLAIN, Terrain.PLAIN],
+        Terrain.PLATEAU
+    ).astype(np.uint8)
+
+
+async def get_elevations(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """
+    Elevations for many points using batched open-meteo requests (ELEVATION_BATCH_SIZE per call).
+    Points are canonicalized to "geo" cells so each distinct cell is looked up once; points
+    that fail to resolve get the same 200 m default as get_fallback_geographic_data.
+    """
+    keys, point_cell = np.unique(encode_cells(lats, lons, CELL_PRECISION["geo"]), return_inverse=True)
+    cell_lats, cell_lons = decode_cells(keys)
+    cell_elevations = np.full(len(keys), 200.0)
+    missing = []
+    for i, cached in enumerate(await asyncio.gather(*(cache_get("elevation", key) for key in keys))):
+        if cached is None:
+            missing.append(i)
+        else:
+            cell_elevations[i] = cached
+
+    async with create_http_client() as client:
+        for start in range(0, len(missing), ELEVATION_BATCH_SIZE):
+            batch = missing[start:start + ELEVATION_BATCH_SIZE]
+            try:
+                response = await client.get(ELEVATION_API_URL, params={
+                    "latitude": ",".join(f"{cell_lats[i]:.5f}" for i in batch),
+                    "longitude": ",".join(f"{cell_lons[i]:.5f}" for i in batch)
+                }, timeout=10.0)
+                response.raise_for_status()
+                values = response.json().get("elevation", [])
+            except Exception as e:
+                print(f"Batch elevation API error: {str(e)}")
+                continue
+
+            for i, value in zip(batch, values):
+                if value is not None:
+                    cell_elevations[i] = value
+                    cache_set("elevation", str(keys[i]), value, CACHE_TTL_GEOGRAPHIC)
+
+    return cell_elevations[point_cell.ravel()]
 
 
 async def calculate_coastal_proximity(lat: float, lon: float) -> float:
@@ -93,7 +145,7 @@ async def calculate_coastal_proximity(lat: float, lon: float) -> float:
     Calculate actual distance to nearest coast using coastline data API
     """
     try:
-        async with httpx.AsyncClient() as client:
+        async with create_http_client() as client:
             params = {
                 "q": "coastline",
                 "lat": lat,
@@ -104,6 +156,7 @@ async def calculate_coastal_proximity(lat: float, lon: float) -> float:
                 "addressdetails": 1
             }
 
+            await acquire("nominatim")
             response = await client.get(NOMINATIM_URL, params=params, timeout=10.0)
             response.raise_for_status()
             data = response.json()
@@ -123,6 +176,8 @@ async def calculate_coastal_proximity(lat: float, lon: float) -> float:
             else:
                 return calculate_coastal_proximity_fallback(lat, lon)
 
+    except UpstreamOverloaded:
+        raise
     except Exception as e:
         print(f"Coastal proximity API error: {str(e)}")
         return calculate_coastal_proximity_fallback(lat, lon)
@@ -187,68 +242,102 @@ def get_seismic_zone(lat: float, lon: float) -> int:
         return 3
 
 
-def get_climate_zone(lat: float, lon: float) -> str:
+def get_seismic_zones(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Vectorized get_seismic_zone; the conditions must stay in the same order"""
+    def box(lat_min, lat_max, lon_min, lon_max):
+        return (lats >= lat_min) & (lats <= lat_max) & (lons >= lon_min) & (lons <= lon_max)
+
+    return np.select([
+        box(24.0, 37.0, 74.0, 97.0), box(26.0, 29.0, 88.0, 97.0), box(23.0, 26.0, 69.0, 72.0),
+        box(28.0, 32.0, 75.0, 80.0), box(30.0, 32.0, 76.0, 78.0), box(23.0, 26.0, 72.0, 75.0),
+        box(11.0, 13.0, 74.0, 78.0), box(8.0, 12.0, 76.0, 78.0),
+        box(26.0, 30.0, 72.0, 78.0), box(20.0, 26.0, 72.0, 82.0), box(15.0, 20.0, 73.0, 80.0),
+        box(20.0, 25.0, 82.0, 87.0), box(15.0, 20.0, 80.0, 85.0),
+        box(8.0, 15.0, 75.0, 80.0), box(20.0, 24.0, 78.0, 82.0),
+    ], [5, 5, 5, 4, 4, 4, 4, 4, 3, 3, 3, 3, 3, 2, 2], 3)
+
+
+def get_climate_zone(lat: float, lon: float) -> ClimateZone:
     """
     Get climate zone for Indian coordinates based on actual climate data
     """
     # Tropical Wet (Western Ghats, Northeast India)
     if ((8.0 <= lat <= 21.0 and 72.5 <= lon <= 77.5) or  # Western Ghats
             (22.0 <= lat <= 29.0 and 88.0 <= lon <= 97.0)):   # Northeast India
-        return "tropical_wet"
+        return ClimateZone.TROPICAL_WET
 
     # Tropical Wet and Dry (Central India, Eastern Coast)
     elif ((15.0 <= lat <= 25.0 and 75.0 <= lon <= 87.0) or  # Central India
           (8.0 <= lat <= 20.0 and 77.0 <= lon <= 87.0)):     # Eastern peninsular India
-        return "tropical_wet_dry"
+        return ClimateZone.TROPICAL_WET_DRY
 
     # Hot Semi-Arid (Deccan Plateau, parts of Rajasthan)
     elif ((15.0 <= lat <= 25.0 and 72.0 <= lon <= 80.0) or  # Deccan Plateau
           (22.0 <= lat <= 28.0 and 70.0 <= lon <= 78.0)):    # Parts of Rajasthan, Haryana
-        return "hot_semi_arid"
+        return ClimateZone.HOT_SEMI_ARID
 
     # Hot Arid (Thar Desert, Western Rajasthan)
     elif (24.0 <= lat <= 30.0 and 68.0 <= lon <= 75.0):      # Rajasthan desert region
-        return "hot_arid"
+        return ClimateZone.HOT_ARID
 
     # Humid Subtropical (Northern Plains)
     elif (24.0 <= lat <= 32.0 and 75.0 <= lon <= 88.0):      # Indo-Gangetic Plains
-        return "humid_subtropical"
+        return ClimateZone.HUMID_SUBTROPICAL
 
     # Montane (Himalayan regions)
     elif lat > 30.0:                                          # Himalayan region
         if lat > 32.0:
-            return "alpine"
+            return ClimateZone.ALPINE
         else:
-            return "montane"
+            return ClimateZone.MONTANE
 
     # Coastal (Coastal areas)
     elif ((8.0 <= lat <= 25.0 and 68.0 <= lon <= 74.0) or   # West coast
           (8.0 <= lat <= 22.0 and 80.0 <= lon <= 87.5)):     # East coast
-        return "tropical_coastal"
+        return ClimateZone.TROPICAL_COASTAL
 
     # Island Tropical (Andaman & Nicobar, Lakshadweep)
     elif ((6.0 <= lat <= 14.0 and 92.0 <= lon <= 94.0) or   # Andaman & Nicobar
           (8.0 <= lat <= 12.0 and 71.0 <= lon <= 74.0)):     # Lakshadweep
-        return "island_tropical"
+        return ClimateZone.ISLAND_TROPICAL
 
     # Default for other areas
     else:
-        return "subtropical"
-
-
-async def get_fallback_geographic_data(lat: float, lon: float) -> Dict[str, Any]:
+        return ClimateZone.SUBTROPICAL
+
+
+def get_climate_zones(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Vectorized get_climate_zone as uint8 ClimateZone codes; the conditions must stay in the same order"""
+    def box(lat_min, lat_max, lon_min, lon_max):
+        return (lats >= lat_min) & (lats <= lat_max) & (lons >= lon_min) & (lons <= lon_max)
+
+    return np.select([
+        box(8.0, 21.0, 72.5, 77.5) | box(22.0, 29.0, 88.0, 97.0),
+        box(15.0, 25.0, 75.0, 87.0) | box(8.0, 20.0, 77.0, 87.0),
+        box(15.0, 25.0, 72.0, 80.0) | box(22.0, 28.0, 70.0, 78.0),
+        box(24.0, 30.0, 68.0, 75.0),
+        box(24.0, 32.0, 75.0, 88.0),
+        lats > 32.0,
+        lats > 30.0,
+        box(8.0, 25.0, 68.0, 74.0) | box(8.0, 22.0, 80.0, 87.5),
+        box(6.0, 14.0, 92.0, 94.0) | box(8.0, 12.0, 71.0, 74.0),
+    ], [
+        ClimateZone.TROPICAL_WET, ClimateZone.TROPICAL_WET_DRY, ClimateZone.HOT_SEMI_ARID, ClimateZone.HOT_ARID,
+        ClimateZone.HUMID_SUBTROPICAL, ClimateZone.ALPINE, ClimateZone.MONTANE, ClimateZone.TROPICAL_COASTAL,
+        ClimateZone.ISLAND_TROPICAL
+    ], ClimateZone.SUBTROPICAL).astype(np.uint8)
+
+
+async def get_fallback_geographic_data(lat: float, lon: float) -> GeoFeatures:
     """
     Provide fallback geographic data with proper structure
     """
     elevation = 200  # Default elevation
 
-    return {
-        "elevation": elevation,
-        "terrain": await classify_terrain(elevation, lat, lon),
-        "seismic_zone": get_seismic_zone(lat, lon),
-        "climate_zone": get_climate_zone(lat, lon),
-        "raw_data": {
-            "source": "fallback",
-            "error": "Geographic data APIs unavailable"
-        }
-    }
+    return GeoFeatures(
+        elevation,
+        await classify_terrain(elevation, lat, lon),
+        get_seismic_zone(lat, lon),
+        get_climate_zone(lat, lon),
+        "fallback"
+    )
@@ -0,0 +1,40 @@
+"""
+HTTP conditional caching for responses built from cached upstream data.
+
+Validators are derived from the canonical cell of a request and the version of the data
+behind the response (the weather fetch timestamp, the OSM database timestamp), so a repeat
+request carrying If-None-Match can be answered with 304 Not Modified before any analysis
+runs, and a CDN or reverse proxy can revalidate instead of re-downloading.
+"""
+import hashlib
+from typing import Dict, Optional
+from fastapi.responses import Response
+
+VARY = "Accept-Encoding"
+
+
+def make_etag(*parts) -> str:
+    """Weak ETag over the given parts: equal parts mean semantically equal responses"""
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()[:24]
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def cache_headers(etag: Optional[str], max_age: int) -> Dict[str, str]:
+    """Validator and freshness headers; responses without an ETag are not to be stored"""
+    if etag is None:
+        return {"Cache-Control": "no-store"}
+    return {"ETag": etag, "Cache-Control": f"public, max-age={max_age}", "Vary": VARY}
+
+
+def not_modified(etag: str, max_age: int) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag, max_age))
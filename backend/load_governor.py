@@ -0,0 +1,138 @@
+"""
+Adaptive load shedding driven by event-loop lag, in-flight requests and upstream queue depth.
+
+A monitor task samples the three signals and sets a degradation level for the worker:
+
+    0 full        LLM analysis as normal
+    1 cached-llm  LLM results are served from cache only, misses get the rule-based analysis
+    2 rule-based  only the rule-based analysis is served
+    3 shed        additionally, GOVERNOR_NON_CRITICAL_PATHS are answered with 503
+
+The level rises as soon as any signal crosses a threshold and falls one step at a time once
+the signals have stayed below it for GOVERNOR_RECOVERY_SECONDS. Every HTTP response carries
+the level in the X-Degradation-Level header.
+"""
+import asyncio
+import bisect
+import time
+from typing import Dict, Any
+import orjson
+from config import (
+    GOVERNOR_SAMPLE_INTERVAL, GOVERNOR_LAG_SMOOTHING, GOVERNOR_LAG_THRESHOLDS,
+    GOVERNOR_IN_FLIGHT_THRESHOLDS, GOVERNOR_QUEUE_THRESHOLDS, GOVERNOR_RECOVERY_SECONDS,
+    GOVERNOR_NON_CRITICAL_PATHS
+)
+from rate_limiter import queue_depths
+
+LEVEL_FULL = 0
+LEVEL_CACHED_LLM = 1
+LEVEL_RULE_BASED = 2
+LEVEL_SHED = 3
+LEVEL_NAMES = ("full", "cached-llm", "rule-based", "shed")
+
+LEVEL_HEADER = "X-Degradation-Level"
+
+
+class LoadGovernor:
+    def __init__(self):
+        self.level = LEVEL_FULL
+        self.loop_lag = 0.0  # smoothed, seconds
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.level_changes = 0
+        self.shed_requests = 0
+        self.requests_by_level = [0] * len(LEVEL_NAMES)
+        self._calm_since = time.monotonic()
+
+    def observe(self, lag: float, now: float):
+        """Fold in one lag sample and move the level towards what the signals call for"""
+        self.loop_lag += GOVERNOR_LAG_SMOOTHING * (lag - self.loop_lag)
+        self.queue_depth = max(queue_depths().values(), default=0)
+        target = max(
+            bisect.bisect_right(GOVERNOR_LAG_THRESHOLDS, self.loop_lag),
+            bisect.bisect_right(GOVERNOR_IN_FLIGHT_THRESHOLDS, self.in_flight),
+            bisect.bisect_right(GOVERNOR_QUEUE_THRESHOLDS, self.queue_depth)
+        )
+
+        if target >= self.level:
+            self._calm_since = now
+            if target > self.level:
+                self._set_level(target)
+        elif now - self._calm_since >= GOVERNOR_RECOVERY_SECONDS:
+            self._calm_since = now
+            self._set_level(self.level - 1)
+
+    def _set_level(self, level: int):
+        print(f"Load governor: {LEVEL_NAMES[self.level]} -> {LEVEL_NAMES[level]} "
+              f"(lag {self.loop_lag * 1000:.0f} ms, in flight {self.in_flight}, queue {self.queue_depth})")
+        self.level = level
+        self.level_changes += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "level": self.level,
+            "level_name": LEVEL_NAMES[self.level],
+            "loop_lag_ms": round(self.loop_lag * 1000, 1),
+            "in_flight": self.in_flight,
+            "upstream_queues": queue_depths(),
+            "level_changes": self.level_changes,
+            "shed_requests": self.shed_requests,
+            "requests_by_level": dict(zip(LEVEL_NAMES, self.requests_by_level))
+        }
+
+
+governor = LoadGovernor()
+
+
+def current_level() -> int:
+    return governor.level
+
+
+async def run_load_monitor():
+    """Background task measuring how late the event loop wakes up from a fixed sleep"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + GOVERNOR_SAMPLE_INTERVAL
+        await asyncio.sleep(GOVERNOR_SAMPLE_INTERVAL)
+        now = loop.time()
+        governor.observe(max(0.0, now - expected), now)
+
+
+class LoadGovernorMiddleware:
+    """ASGI middleware counting in-flight requests, shedding non-critical ones and tagging responses"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        level = governor.level
+        header = (LEVEL_HEADER.lower().encode(), LEVEL_NAMES[level].encode())
+        governor.requests_by_level[level] += 1
+
+        if level >= LEVEL_SHED and scope["path"] in GOVERNOR_NON_CRITICAL_PATHS:
+            governor.shed_requests += 1
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [(b"content-type", b"application/json"), (b"retry-after", b"10"), header]
+            })
+            await send({
+                "type": "http.response.body",
+                "body": orjson.dumps({"detail": "Server is under heavy load, please retry later"})
+            })
+            return
+
+        async def tagged_send(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [header]
+            await send(message)
+
+        governor.in_flight += 1
+        try:
+            await self.app(scope, receive, tagged_send)
+        finally:
+            governor.in_flight -= 1
@@ -1,145 +1,505 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse, ORJSONResponse
+from typing import Optional, Tuple
+from contextlib import asynccontextmanager
 import asyncio
-import httpx
-from models import CoordinateRequest, DisasterPrediction
-from weather_service import get_weather_data
-from geographic_service import get_geographic_data, get_location_info
-from disaster_analysis import analyze_disaster_risk_with_groq
-from config import INDIA_LAT_MIN, INDIA_LAT_MAX, INDIA_LON_MIN, INDIA_LON_MAX, PORT
+import orjson
+from models import (
+    CoordinateRequest, BulkCoordinateRequest, RouteRiskRequest, AlertSubscriptionRequest, DisasterPrediction,
+    FacilitySelectionRequest
+)
+from weather_service import get_weather_data, get_weather_data_many
+from records import WeatherReport
+from geographic_service import get_geographic_data, get_location_info, get_seismic_zone
+from disaster_analysis import analyze_disaster_risk_with_groq, analyze_disaster_risk_bulk, stream_disaster_analysis
+from utils import (
+    parse_fields, project_fields, is_severe_weather, calculate_haversine_distance, canonical_cell
+)
+from rate_limiter import request_priority, UpstreamOverloaded, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+from cache_store import warm_start, close_cache, cache_get, cache_set
+from http_cache import make_etag, etag_matches, cache_headers, not_modified
+from cpu_pool import start_cpu_pool, shutdown_cpu_pool
+from traffic_capture import flush_capture, TrafficCaptureMiddleware
+from route_service import assess_route_risk
+import alert_service
+from subscription_store import close_store
+from tracking_service import TrackingSession
+from load_governor import governor, run_load_monitor, LoadGovernorMiddleware, LEVEL_HEADER, LEVEL_FULL
+from exposure_service import with_exposure, cached_exposure, exposure_digest
+from facility_service import fetch_buildings_and_facilities, select_facility, OverpassError
+from config import (
+    INDIA_LAT_MIN, INDIA_LAT_MAX, INDIA_LON_MIN, INDIA_LON_MAX, PORT, BULK_MAX_LOCATIONS, BULK_MAX_WEATHER_SECONDS,
+    ROUTE_DEFAULT_SPACING_M, ROUTE_MIN_SPACING_M, ROUTE_MAX_SAMPLES, FACILITY_DEFAULT_RADIUS_M,
+    OVERPASS_MAX_RADIUS_M, GROQ_ANALYSIS_MODE, HTTP_MAX_AGE_PREDICTION, HTTP_MAX_AGE_BUILDINGS, CACHE_TTL_WEATHER
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    print(f"Cache warm start loaded {warm_start()} entries")
+    print(f"CPU pool started with {start_cpu_pool()} processes")
+    evaluator = asyncio.create_task(alert_service.run_alert_evaluator())
+    monitor = asyncio.create_task(run_load_monitor())
+    yield
+    monitor.cancel()
+    evaluator.cancel()
+    shutdown_cpu_pool()
+    flush_capture()
+    close_store()
+    close_cache()
+
 
 app = FastAPI(
     title="SafeRoute API",
     description="A API for SafeRoute with Natural Disaster Prediction",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
+app.add_middleware(TrafficCaptureMiddleware)
+app.add_middleware(LoadGovernorMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[LEVEL_HEADER, "ETag"],
 )
 
 
+@app.exception_handler(UpstreamOverloaded)
+async def upstream_overloaded_handler(request: Request, exc: UpstreamOverloaded):
+    return ORJSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "5"}
+    )
+
+
+def _prioritize(lat: float, lon: float, weather_data: Optional[WeatherReport] = None):
+    """Admit callers in high seismic zones or under severe weather ahead of others upstream"""
+    if get_seismic_zone(lat, lon) >= 4 or (weather_data is not None and is_severe_weather(weather_data)):
+        request_priority.set(PRIORITY_HIGH)
+    else:
+        request_priority.set(PRIORITY_NORMAL)
+
+
 @app.get("/")
 async def root():
     return {"message": "SafeRoute Natural Disaster Predictor API is Working!"}
 
 
+@app.get("/metrics")
+async def metrics():
+    """Load governor state: degradation level, event-loop lag, in-flight requests and upstream queues"""
+    return governor.snapshot()
+
+
 @app.post("/predict-disaster", response_model=DisasterPrediction)
-async def predict_natural_disaster(request: CoordinateRequest):
+async def predict_natural_disaster(
+    request: CoordinateRequest, http_request: Request, fields: Optional[str] = None
+):
+    """
+    Predict natural disaster risk for a location.
+
+    Args:
+        request: CoordinateRequest with latitude and longitude
+        fields: Comma-separated dotted paths to return, e.g. "analysis.conclusion,location_info.city"
+
+    Responses carry an ETag; a request whose If-None-Match matches gets 304 without analysis.
+    """
+    return await _predict_conditional(
+        request.latitude, request.longitude, fields, http_request.headers.get("if-none-match"))
+
+
+@app.get("/predict-disaster", response_model=DisasterPrediction)
+async def predict_natural_disaster_get(
+    latitude: float, longitude: float, http_request: Request, fields: Optional[str] = None
+):
+    """GET alias of POST /predict-disaster that browsers, CDNs and proxies can cache"""
+    return await _predict_conditional(
+        latitude, longitude, fields, http_request.headers.get("if-none-match"))
+
+
+async def _predict_conditional(
+    lat: float, lon: float, fields: Optional[str], if_none_match: Optional[str]
+):
     try:
-        if not (INDIA_LAT_MIN <= request.latitude <= INDIA_LAT_MAX and INDIA_LON_MIN <= request.longitude <= INDIA_LON_MAX):
+        if not (INDIA_LAT_MIN <= lat <= INDIA_LAT_MAX and INDIA_LON_MIN <= lon <= INDIA_LON_MAX):
             raise HTTPException(
                 status_code=400, detail="Coordinates must be within India")
 
-        print(
-            f"Processing coordinates: {request.latitude}, {request.longitude}")
+        # Weather is cached per cell, so this is cheap and gives the data version for the ETag
+        _prioritize(lat, lon)
+        weather_data = await get_weather_data(lat, lon)
+        etag, etag_key = await _prediction_etag(lat, lon, weather_data, fields)
+        full_fidelity = etag is not None and governor.level == LEVEL_FULL
+        if etag_matches(if_none_match, etag):
+            # Degraded: only revalidate what a full-fidelity response was actually sent for
+            if full_fidelity or await cache_get("etag", etag_key) == etag:
+                return not_modified(etag, HTTP_MAX_AGE_PREDICTION)
+
+        prediction = await _run_prediction(lat, lon, weather_data)
+        if not full_fidelity or prediction.fallback:
+            etag = None  # degraded or rule-based after an LLM failure; the next request should retry
+        else:
+            cache_set("etag", etag_key, etag, CACHE_TTL_WEATHER)
+        return ORJSONResponse(
+            _shape_prediction(prediction.model_dump(), fields),
+            headers=cache_headers(etag, HTTP_MAX_AGE_PREDICTION)
+        )
+
+    except (HTTPException, UpstreamOverloaded):
+        raise
+    except Exception as e:
+        print(f"Error in predict_natural_disaster: {str(e)}")
+        raise HTTPException(
+            status_code=500, detail=f"Prediction failed: {str(e)}")
+
+
+async def _prediction_etag(
+    lat: float, lon: float, weather_data: WeatherReport, fields: Optional[str]
+) -> Tuple[Optional[str], str]:
+    """
+    Validator for a prediction, and the key under which the last one sent with a
+    full-fidelity response is kept. The validator covers the finest cell the response
+    depends on, the weather version and everything else that shapes the body; it is None
+    for fallback weather, whose responses are never reused.
+    """
+    cell, _, _ = canonical_cell(lat, lon, "geo")
+    etag_key = f"prediction:{cell}:{fields or ''}"
+    if weather_data.source == "fallback":
+        return None, etag_key
+    exposure = await cached_exposure(lat, lon)
+    return make_etag(cell, weather_data.timestamp, GROQ_ANALYSIS_MODE, fields, exposure_digest(exposure)), etag_key
+
+
+async def _run_prediction(lat: float, lon: float, weather_data: Optional[WeatherReport] = None) -> DisasterPrediction:
+    """Fetch weather (unless given), geographic and location data and analyze them"""
+    print(f"Processing coordinates: {lat}, {lon}")
 
+    _prioritize(lat, lon)
+    if weather_data is None:
+        weather_data, geographic_data, location_info = await asyncio.gather(
+            get_weather_data(lat, lon),
+            get_geographic_data(lat, lon),
+            get_location_info(lat, lon)
+        )
+    else:
+        geographic_data, location_info = await asyncio.gather(
+            get_geographic_data(lat, lon),
+            get_location_info(lat, lon)
+        )
+
+    print("Data fetched successfully, analyzing with Groq...")
+    _prioritize(lat, lon, weather_data)
+    geographic_data = await with_exposure(geographic_data, lat, lon)
+
+    return await analyze_disaster_risk_with_groq(
+        weather_data, geographic_data, location_info, lat, lon
+    )
+
+
+def _shape_prediction(prediction: dict, fields: Optional[str]) -> dict:
+    """Apply the ?fields= projection to a prediction dict"""
+    paths = parse_fields(fields)
+    return project_fields(prediction, paths) if paths else prediction
+
+
+@app.post("/predict-disaster/bulk")
+async def predict_natural_disaster_bulk(request: BulkCoordinateRequest, fields: Optional[str] = None):
+    """
+    Predict disaster risk for many sites (depots, shelters, schools) at once.
+
+    Sites are packed several per Groq completion; the response lists predictions
+    in request order. Accepts the same fields option as /predict-disaster.
+    Upstream calls run below interactive requests, and weather for uncached sites is
+    paced to the OpenWeather rate limit (see BULK_MAX_WEATHER_SECONDS).
+    """
+    if not request.locations or len(request.locations) > BULK_MAX_LOCATIONS:
+        raise HTTPException(
+            status_code=400, detail=f"Provide between 1 and {BULK_MAX_LOCATIONS} locations")
+    outside = [i for i, loc in enumerate(request.locations)
+               if not (INDIA_LAT_MIN <= loc.latitude <= INDIA_LAT_MAX and INDIA_LON_MIN <= loc.longitude <= INDIA_LON_MAX)]
+    if outside:
+        raise HTTPException(
+            status_code=400, detail=f"Coordinates must be within India (locations {outside})")
+
+    try:
+        request_priority.set(PRIORITY_LOW)
+        weather, places = await asyncio.gather(
+            get_weather_data_many([(loc.latitude, loc.longitude) for loc in request.locations],
+                                  BULK_MAX_WEATHER_SECONDS),
+            asyncio.gather(*(
+                asyncio.gather(get_geographic_data(loc.latitude, loc.longitude),
+                               get_location_info(loc.latitude, loc.longitude))
+                for loc in request.locations
+            ))
+        )
+        sites = [
+            (weather_data, await with_exposure(geographic_data, loc.latitude, loc.longitude), location_info,
+             loc.latitude, loc.longitude)
+            for weather_data, (geographic_data, location_info), loc in zip(weather, places, request.locations)
+        ]
+        predictions = await analyze_disaster_risk_bulk(sites)
+
+        return ORJSONResponse({
+            "predictions": [_shape_prediction(p.model_dump(), fields) for p in predictions]
+        })
+
+    except UpstreamOverloaded:
+        raise
+    except Exception as e:
+        print(f"Error in predict_natural_disaster_bulk: {str(e)}")
+        raise HTTPException(
+            status_code=500, detail=f"Bulk prediction failed: {str(e)}")
+
+
+@app.post("/predict-disaster/stream")
+async def stream_natural_disaster_prediction(request: CoordinateRequest):
+    """
+    Server-Sent Events variant of /predict-disaster.
+
+    Emits a `section` event for each hazard as soon as the LLM finishes it, then a
+    `complete` event carrying the full prediction.
+    """
+    if not (INDIA_LAT_MIN <= request.latitude <= INDIA_LAT_MAX and INDIA_LON_MIN <= request.longitude <= INDIA_LON_MAX):
+        raise HTTPException(
+            status_code=400, detail="Coordinates must be within India")
+
+    _prioritize(request.latitude, request.longitude)
+    try:
         weather_data, geographic_data, location_info = await asyncio.gather(
             get_weather_data(request.latitude, request.longitude),
             get_geographic_data(request.latitude, request.longitude),
             get_location_info(request.latitude, request.longitude)
         )
+    except UpstreamOverloaded:
+        raise
+    except Exception as e:
+        print(f"Error in stream_natural_disaster_prediction: {str(e)}")
+        raise HTTPException(
+            status_code=500, detail=f"Prediction failed: {str(e)}")
 
-        print("Data fetched successfully, analyzing with Groq...")
+    _prioritize(request.latitude, request.longitude, weather_data)
+    geographic_data = await with_exposure(geographic_data, request.latitude, request.longitude)
 
-        prediction = await analyze_disaster_risk_with_groq(
+    async def event_stream():
+        analysis = {}
+        async for section, data in stream_disaster_analysis(
             weather_data, geographic_data, location_info, request.latitude, request.longitude
+        ):
+            analysis[section] = data
+            yield _sse_event("section", {"section": section, "data": data})
+
+        prediction = DisasterPrediction(
+            geographic_data=geographic_data.to_dict(),
+            location_info=location_info.to_dict(),
+            analysis=analysis
         )
+        yield _sse_event("complete", prediction.model_dump())
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-        return prediction
 
-    except HTTPException:
+def _sse_event(event: str, data: dict) -> str:
+    """Format a Server-Sent Events message"""
+    return f"event: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
+
+
+@app.post("/route-risk")
+async def assess_route_corridor_risk(request: RouteRiskRequest):
+    """
+    Assess disaster risk along a route to a facility.
+
+    Args:
+        request: RouteRiskRequest with the route polyline as [latitude, longitude] pairs
+                 and an optional sample spacing in metres (default: ROUTE_DEFAULT_SPACING_M)
+
+    Returns:
+        Per-segment rule-based risk along the route and the worst segment
+    """
+    spacing_m = request.spacing_m or ROUTE_DEFAULT_SPACING_M
+    points = request.polyline
+
+    if len(points) < 2 or any(len(point) != 2 for point in points):
+        raise HTTPException(
+            status_code=400, detail="polyline needs at least two [latitude, longitude] points")
+    if spacing_m < ROUTE_MIN_SPACING_M:
+        raise HTTPException(
+            status_code=400, detail=f"spacing_m must be at least {ROUTE_MIN_SPACING_M}")
+    if not all(INDIA_LAT_MIN <= lat <= INDIA_LAT_MAX and INDIA_LON_MIN <= lon <= INDIA_LON_MAX for lat, lon in points):
+        raise HTTPException(
+            status_code=400, detail="Coordinates must be within India")
+
+    length_m = 1000 * sum(calculate_haversine_distance(a[0], a[1], b[0], b[1]) for a, b in zip(points, points[1:]))
+    if length_m / spacing_m > ROUTE_MAX_SAMPLES:
+        raise HTTPException(
+            status_code=400, detail=f"Route too long for spacing_m={spacing_m:.0f} (max {ROUTE_MAX_SAMPLES} samples)")
+
+    try:
+        _prioritize(points[0][0], points[0][1])
+        return await assess_route_risk(points, spacing_m)
+
+    except UpstreamOverloaded:
         raise
     except Exception as e:
-        print(f"Error in predict_natural_disaster: {str(e)}")
+        print(f"Error in assess_route_corridor_risk: {str(e)}")
         raise HTTPException(
-            status_code=500, detail=f"Prediction failed: {str(e)}")
+            status_code=500, detail=f"Route risk assessment failed: {str(e)}")
+
+
+@app.post("/alerts/subscriptions")
+async def create_alert_subscription(request: AlertSubscriptionRequest):
+    """
+    Subscribe a client to alerts for a location.
+
+    Updates are pushed over the /alerts/ws/{client_id} WebSocket whenever the location's
+    rule-based probability crosses the threshold or moves by ALERT_MIN_CHANGE while above it.
+    """
+    if not (INDIA_LAT_MIN <= request.latitude <= INDIA_LAT_MAX and INDIA_LON_MIN <= request.longitude <= INDIA_LON_MAX):
+        raise HTTPException(
+            status_code=400, detail="Coordinates must be within India")
+
+    try:
+        subscription = await alert_service.subscribe(
+            request.client_id, request.latitude, request.longitude, request.threshold)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"subscription_id": subscription.id, "threshold": subscription.threshold}
+
+
+@app.delete("/alerts/subscriptions/{subscription_id}")
+async def delete_alert_subscription(subscription_id: str, client_id: str):
+    """Remove a subscription; only the client that created it may do so"""
+    if not await alert_service.unsubscribe(subscription_id, client_id):
+        raise HTTPException(status_code=404, detail="Subscription not found")
+    return {"deleted": subscription_id}
+
+
+@app.websocket("/alerts/ws/{client_id}")
+async def alert_updates(websocket: WebSocket, client_id: str):
+    """Push alert updates for all of a client's subscriptions"""
+    await websocket.accept()
+    queue = await alert_service.connect(client_id)
+    try:
+        while True:
+            await websocket.send_json(await queue.get())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        alert_service.disconnect(client_id, queue)
+
+
+@app.websocket("/track")
+async def track_position(websocket: WebSocket):
+    """
+    Live position tracking.
+
+    The client sends GPS fixes as {"latitude": ..., "longitude": ...}. A fresh prediction
+    is sent only when the traveller enters a new grid cell or the cell's data changes;
+    other fixes get a small {"type": "ack"} reply.
+    """
+    await websocket.accept()
+    session = TrackingSession()
+    try:
+        while True:
+            fix = await websocket.receive_json()
+            try:
+                lat, lon = float(fix["latitude"]), float(fix["longitude"])
+            except (KeyError, TypeError, ValueError):
+                await websocket.send_json({"type": "error", "detail": "Expected latitude and longitude"})
+                continue
+            if not (INDIA_LAT_MIN <= lat <= INDIA_LAT_MAX and INDIA_LON_MIN <= lon <= INDIA_LON_MAX):
+                await websocket.send_json({"type": "error", "detail": "Coordinates must be within India"})
+                continue
+
+            if not session.needs_evaluation(lat, lon):
+                await websocket.send_json({"type": "ack", "fixes": session.fixes})
+                continue
+
+            try:
+                prediction = await _run_prediction(lat, lon)
+            except UpstreamOverloaded as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                continue
+            session.mark_evaluated()
+            await websocket.send_json({
+                "type": "prediction",
+                "fixes": session.fixes,
+                "evaluations": session.evaluations,
+                "prediction": prediction.model_dump()
+            })
+    except WebSocketDisconnect:
+        pass
+    finally:
+        session.close()
 
 
 @app.post("/buildings-emergency")
-async def get_buildings_and_emergency_facilities(request: CoordinateRequest, radius: int = 1000):
+async def get_buildings_and_emergency_facilities(request: CoordinateRequest, http_request: Request, radius: int = 1000):
     """
     Get buildings with height data and emergency facilities within a specified radius from coordinates.
     
     Args:
         request: CoordinateRequest with latitude and longitude
-        radius: Radius in meters (default: 1000)
+        radius: Radius in meters (default: 1000, at most OVERPASS_MAX_RADIUS_M)
     
     Returns:
-        JSON data from Overpass API containing buildings and emergency facilities
+        JSON data from Overpass API containing buildings and emergency facilities, and the
+        coverage achieved when the area was fetched as several sub-boxes. The query is centred
+        on the "buildings" cell containing the coordinates, so nearby requests share an ETag.
     """
+    return await _buildings_conditional(
+        request.latitude, request.longitude, radius, http_request.headers.get("if-none-match"))
+
+
+@app.get("/buildings-emergency")
+async def get_buildings_and_emergency_facilities_get(
+    latitude: float, longitude: float, http_request: Request, radius: int = 1000
+):
+    """GET alias of POST /buildings-emergency that browsers, CDNs and proxies can cache"""
+    return await _buildings_conditional(latitude, longitude, radius, http_request.headers.get("if-none-match"))
+
+
+async def _buildings_conditional(lat: float, lon: float, radius: int, if_none_match: Optional[str]):
     try:
-        if not (INDIA_LAT_MIN <= request.latitude <= INDIA_LAT_MAX and INDIA_LON_MIN <= request.longitude <= INDIA_LON_MAX):
+        if not (INDIA_LAT_MIN <= lat <= INDIA_LAT_MAX and INDIA_LON_MIN <= lon <= INDIA_LON_MAX):
             raise HTTPException(
                 status_code=400, detail="Coordinates must be within India")
+        if not (0 < radius <= OVERPASS_MAX_RADIUS_M):
+            raise HTTPException(
+                status_code=400, detail=f"radius must be between 1 and {OVERPASS_MAX_RADIUS_M} metres")
+
+        # The ETag of the last complete response for this cell and radius; validating against
+        # it avoids re-running the Overpass queries until it expires
+        cell, center_lat, center_lon = canonical_cell(lat, lon, "buildings")
+        etag_key = f"{cell}:{radius}"
+        etag = await cache_get("etag", etag_key)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag, HTTP_MAX_AGE_BUILDINGS)
+
+        _prioritize(lat, lon)
+        area = await fetch_buildings_and_facilities(center_lat, center_lon, radius)
+        etag = None
+        if area.coverage["complete"]:
+            etag = make_etag(cell, radius, area.header.get("osm3s", {}).get("timestamp_osm_base"))
+            cache_set("etag", etag_key, etag, HTTP_MAX_AGE_BUILDINGS)
+        return Response(
+            content=area.to_json(), media_type="application/json",
+            headers=cache_headers(etag, HTTP_MAX_AGE_BUILDINGS)
+        )
 
-        # Calculate bounding box for the radius
-        lat_offset = radius / 111320.0  # Approximate meters per degree latitude
-        lon_offset = radius / (111320.0 * abs(request.latitude) * 0.017453292519943295)  # Adjust for longitude
-
-        south = request.latitude - lat_offset
-        north = request.latitude + lat_offset
-        west = request.longitude - lon_offset
-        east = request.longitude + lon_offset
-
-        # Overpass API query
-        overpass_query = f"""
-        [out:json][timeout:60];
-        (
-          // General buildings with height
-          way["building"]["height"]({south},{west},{north},{east});
-          relation["building"]["height"]({south},{west},{north},{east});
-          
-          // Emergency/medical buildings
-          way["amenity"~"hospital|clinic|doctors|pharmacy|emergency"]({south},{west},{north},{east});
-          node["amenity"~"hospital|clinic|doctors|pharmacy|emergency"]({south},{west},{north},{east});
-          relation["amenity"~"hospital|clinic|doctors|pharmacy|emergency"]({south},{west},{north},{east});
-        );
-        out body geom;
-        >;
-        out skel qt;
-        """
-
-        # Make request to Overpass API
-        overpass_url = "https://overpass-api.de/api/interpreter"
-        
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(
-                overpass_url,
-                data=overpass_query,
-                headers={"Content-Type": "application/x-www-form-urlencoded"}
-            )
-            
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Overpass API request failed: {response.text}"
-                )
-            
-            data = response.json()
-            
-            # Add metadata to the response
-            result = {
-                "query_info": {
-                    "center": {"latitude": request.latitude, "longitude": request.longitude},
-                    "radius_meters": radius,
-                    "bounding_box": {
-                        "south": south,
-                        "north": north,
-                        "west": west,
-                        "east": east
-                    }
-                },
-                "data": data
-            }
-            
-            return result
-
-    except HTTPException:
+    except OverpassError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except (HTTPException, UpstreamOverloaded):
         raise
     except Exception as e:
         print(f"Error in get_buildings_and_emergency_facilities: {str(e)}")
@@ -149,6 +509,41 @@ async def get_buildings_and_emergency_facilities(request: CoordinateRequest, rad
         )
 
 
+@app.post("/select-facility")
+async def select_emergency_facility(request: FacilitySelectionRequest):
+    """
+    Select the most suitable emergency facility for a disaster at a location.
+
+    Candidates are the given facilities or, if none are given, those found by the
+    /buildings-emergency query within radius. They are scored on facility type, distance and
+    elevation relative to the site; the LLM only breaks near-ties.
+    """
+    if not (INDIA_LAT_MIN <= request.latitude <= INDIA_LAT_MAX and INDIA_LON_MIN <= request.longitude <= INDIA_LON_MAX):
+        raise HTTPException(status_code=400, detail="Coordinates must be within India")
+    if request.radius is not None and not (0 < request.radius <= OVERPASS_MAX_RADIUS_M):
+        raise HTTPException(status_code=400, detail=f"radius must be between 1 and {OVERPASS_MAX_RADIUS_M} metres")
+
+    _prioritize(request.latitude, request.longitude)
+    try:
+        if request.facilities is not None:
+            facilities = [f.model_dump() for f in request.facilities]
+        else:
+            area = await fetch_buildings_and_facilities(
+                request.latitude, request.longitude, request.radius or FACILITY_DEFAULT_RADIUS_M)
+            facilities = area.facilities
+
+        return await select_facility(
+            request.latitude, request.longitude, request.disaster_type, facilities, request.flood_probability)
+
+    except OverpassError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except (HTTPException, UpstreamOverloaded):
+        raise
+    except Exception as e:
+        print(f"Error in select_emergency_facility: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to select facility: {str(e)}")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=PORT)
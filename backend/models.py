@@ -1,5 +1,9 @@
-from pydantic import BaseModel
-from typing import Dict, Any
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Dict, Any, List, Literal, Optional
+
+
+RiskLevel = Literal["Low", "Medium", "High", "Critical"]
+DisasterType = Literal["floods", "cyclone", "earthquakes", "droughts", "landslides"]
 
 
 class CoordinateRequest(BaseModel):
@@ -7,7 +11,74 @@ class CoordinateRequest(BaseModel):
     longitude: float
 
 
+class BulkCoordinateRequest(BaseModel):
+    locations: List[CoordinateRequest]
+
+
+class RouteRiskRequest(BaseModel):
+    polyline: List[List[float]]  # [[latitude, longitude], ...] in travel order
+    spacing_m: Optional[float] = None
+
+
+class AlertSubscriptionRequest(BaseModel):
+    client_id: str
+    latitude: float
+    longitude: float
+    threshold: float = 50.0  # rule-based probability (0-100) that triggers an alert
+
+
+class FacilityCandidate(BaseModel):
+    id: str
+    name: str = ""
+    type: str
+    latitude: float
+    longitude: float
+
+
+class FacilitySelectionRequest(BaseModel):
+    latitude: float
+    longitude: float
+    disaster_type: DisasterType
+    flood_probability: Optional[float] = None  # 0-100; scales the elevation term
+    radius: Optional[int] = None  # used when facilities are fetched server-side
+    facilities: Optional[List[FacilityCandidate]] = None  # e.g. from /buildings-emergency
+
+
+class HazardAssessment(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    probability: float
+    risk_level: RiskLevel
+    recommendations: List[str]
+    analysis: str
+
+
+class ConclusionAssessment(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    probability: float
+    risk_level: RiskLevel
+    primary_threats: List[str]
+    recommendations: List[str]
+    analysis: str
+
+
+class DisasterAnalysis(BaseModel):
+    """Shape of DisasterPrediction.analysis, used to derive the LLM output schema"""
+    model_config = ConfigDict(extra="forbid")
+
+    floods: HazardAssessment
+    cyclone: HazardAssessment
+    earthquakes: HazardAssessment
+    droughts: HazardAssessment
+    landslides: HazardAssessment
+    conclusion: ConclusionAssessment
+
+
 class DisasterPrediction(BaseModel):
     geographic_data: Dict[str, Any]
     analysis: Dict[str, Any]
     location_info: Dict[str, Any]
+    # Rule-based stand-in after an LLM failure or under load; not serialized, and such
+    # responses must not be reused by HTTP caches
+    fallback: bool = Field(default=False, exclude=True)
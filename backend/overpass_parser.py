@@ -0,0 +1,246 @@
+"""
+Parsing of Overpass API responses into a compact form.
+
+parse_overpass_chunk() is CPU-bound and runs in the process pool (see cpu_pool.py) for
+large chunks, so this module only depends on the standard library, NumPy and orjson. Its
+result holds every element re-serialized as compact JSON in one buffer, plus NumPy key
+arrays and building footprint arrays, which pickle as a few flat buffers instead of a tree
+of Python objects.
+"""
+import json
+import re
+import numpy as np
+import orjson
+from typing import Dict, Any, List, Optional, Tuple
+
+ELEMENT_TYPES = ("node", "way", "relation")
+FACILITY_AMENITIES = ("hospital", "clinic", "doctors", "pharmacy", "emergency")
+
+
+class OverpassElementStream:
+    """
+    Incremental parser for an Overpass JSON response arriving in chunks.
+
+    feed() returns the elements that have fully arrived since the previous call; only the
+    unparsed remainder is kept, so memory does not grow with the response size. The members
+    before "elements" are available as header, and close() reads the trailing members, where
+    Overpass reports runtime errors such as timeouts as a "remark". The parser holds no
+    references to outside state, so it can be pickled to the process pool between chunks.
+    """
+
+    _ELEMENTS_START = re.compile(r'"elements"\s*:\s*\[')
+    _SEPARATORS = re.compile(r"[\s,]*")
+    _decoder = json.JSONDecoder()
+
+    def __init__(self):
+        self.header: Dict[str, Any] = {}
+        self.remark: Optional[str] = None
+        self._buffer = ""
+        self._pending = b""  # bytes of a UTF-8 character split across chunks
+        self._in_elements = False
+        self._done = False
+
+    def feed_bytes(self, data: bytes, final: bool = False) -> List[Dict[str, Any]]:
+        """feed() for raw UTF-8 chunks, which may end part-way through a character"""
+        data = self._pending + data
+        self._pending = b""
+        try:
+            text = data.decode("utf-8")
+        except UnicodeDecodeError as e:
+            if final or e.reason != "unexpected end of data":
+                raise
+            text = data[:e.start].decode("utf-8")
+            self._pending = data[e.start:]
+        return self.feed(text)
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self._buffer += chunk
+        if self._done:
+            return []
+        if not self._in_elements:
+            match = self._ELEMENTS_START.search(self._buffer)
+            if match is None:
+                return []
+            self.header = json.loads(self._buffer[:match.start()].rstrip().rstrip(",") + "}")
+            self._buffer = self._buffer[match.end():]
+            self._in_elements = True
+
+        elements = []
+        buffer = self._buffer
+        pos = 0
+        while True:
+            pos = self._SEPARATORS.match(buffer, pos).end()
+            if pos == len(buffer):
+                break
+            if buffer[pos] == "]":
+                self._done = True
+                pos += 1
+                break
+            try:
+                element, pos = self._decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                break  # element not complete yet
+            elements.append(element)
+
+        self._buffer = buffer[pos:]
+        return elements
+
+    def close(self):
+        if not self._done:
+            raise ValueError("Overpass response ended before the elements array was complete")
+        trailing = json.loads("{" + self._buffer.strip().lstrip(",").lstrip())
+        self.remark = trailing.get("remark")
+        self._buffer = ""
+
+
+class BuildingArrays:
+    """Footprint centroid, area and height of building ways, one entry per building"""
+
+    __slots__ = ("ids", "lat", "lon", "area", "height")
+
+    def __init__(self, ids: np.ndarray, lat: np.ndarray, lon: np.ndarray, area: np.ndarray, height: np.ndarray):
+        self.ids = ids
+        self.lat = lat
+        self.lon = lon
+        self.area = area  # m²
+        self.height = height  # m, NaN when the tag could not be read
+
+    @classmethod
+    def concatenate(cls, parts: List["BuildingArrays"]) -> "BuildingArrays":
+        """Join per-sub-box arrays, keeping the first entry of buildings seen in several"""
+        ids = np.concatenate([p.ids for p in parts])
+        _, first = np.unique(ids, return_index=True)
+        return cls(ids[first], *(np.concatenate([getattr(p, name) for p in parts])[first]
+                                 for name in ("lat", "lon", "area", "height")))
+
+
+class ParsedOverpass:
+    """Compact result of parsing one chunk of an Overpass response"""
+
+    __slots__ = ("header", "remark", "types", "ids", "tagged", "offsets", "blob", "facilities", "buildings")
+
+    def __init__(self, header: Dict[str, Any], remark: Optional[str], types: np.ndarray, ids: np.ndarray,
+                 tagged: np.ndarray, offsets: np.ndarray, blob: bytes, facilities: List[Dict[str, Any]],
+                 buildings: BuildingArrays):
+        self.header = header
+        self.remark = remark
+        self.types = types  # index into ELEMENT_TYPES
+        self.ids = ids
+        self.tagged = tagged
+        self.offsets = offsets  # element i is blob[offsets[i]:offsets[i + 1]]
+        self.blob = blob
+        self.facilities = facilities
+        self.buildings = buildings
+
+    def element(self, index: int) -> memoryview:
+        return memoryview(self.blob)[self.offsets[index]:self.offsets[index + 1]]
+
+
+def extract_facility(element: Dict[str, Any], lat: float, lon: float) -> Optional[Dict[str, Any]]:
+    """
+    The emergency facility an element describes, if any, in the same shape and with the same
+    id the frontend derives from /buildings-emergency.
+    """
+    tags = element.get("tags") or {}
+    amenity = tags.get("amenity")
+    if amenity not in FACILITY_AMENITIES:
+        return None
+
+    bounds = element.get("bounds")
+    return {
+        "id": f"{element.get('type')}_{element.get('id')}",
+        "name": tags.get("name") or amenity.capitalize(),
+        "type": "clinic" if amenity == "doctors" else amenity,
+        "latitude": element.get("lat") or ((bounds["minlat"] + bounds["maxlat"]) / 2 if bounds else lat),
+        "longitude": element.get("lon") or ((bounds["minlon"] + bounds["maxlon"]) / 2 if bounds else lon)
+    }
+
+
+_HEIGHT = re.compile(r"\s*([0-9]+(?:\.[0-9]+)?)\s*(m|ft|'|)")
+
+
+def parse_height(value: str) -> float:
+    """Metres from an OSM height tag ("12", "12.5 m", "40 ft"); NaN if unreadable"""
+    match = _HEIGHT.match(value)
+    if match is None:
+        return float("nan")
+    height = float(match.group(1))
+    return height * 0.3048 if match.group(2) in ("ft", "'") else height
+
+
+def footprint_arrays(ids: List[int], counts: List[int], lats: List[float], lons: List[float],
+                     heights: List[float]) -> BuildingArrays:
+    """
+    Centroids and footprint areas of building outlines given as flat vertex lists (counts[i]
+    vertices per building), in one vectorized pass. Each outline is projected to metres
+    around its first vertex and measured with the shoelace formula; with coordinates relative
+    to the first vertex the closing edge contributes nothing, so open and closed rings agree.
+    """
+    counts = np.array(counts, dtype=np.int64)
+    if not len(counts):
+        empty = np.zeros(0)
+        return BuildingArrays(np.zeros(0, dtype=np.int64), empty, empty, empty, empty)
+
+    lat = np.array(lats, dtype=float)
+    lon = np.array(lons, dtype=float)
+    starts = np.cumsum(counts) - counts
+    ref_lat = np.repeat(lat[starts], counts)
+    x = (lon - np.repeat(lon[starts], counts)) * 111320.0 * np.cos(np.radians(ref_lat))
+    y = (lat - ref_lat) * 110540.0
+
+    cross = np.zeros(len(x))
+    cross[:-1] = x[:-1] * y[1:] - x[1:] * y[:-1]
+    cross[starts + counts - 1] = 0.0  # edges from one building's last vertex into the next building
+    area = np.abs(np.add.reduceat(cross, starts)) / 2.0
+
+    return BuildingArrays(
+        np.array(ids, dtype=np.int64),
+        np.add.reduceat(lat, starts) / counts,
+        np.add.reduceat(lon, starts) / counts,
+        area,
+        np.array(heights, dtype=float)
+    )
+
+
+def parse_overpass_chunk(stream: OverpassElementStream, data: bytes, final: bool, lat: float,
+                         lon: float) -> Tuple[OverpassElementStream, ParsedOverpass]:
+    """
+    Parse the next chunk of an Overpass JSON response, extracting facilities and building
+    footprints and re-serializing each element compactly. Returns the updated stream, to be
+    passed with the next chunk, and the elements completed by this one; with final=True the
+    response must be complete, and the result carries its header and remark. Elements are
+    decoded one at a time, so the decoded response never exists as a whole; lat/lon is the
+    position given to facilities without coordinates.
+    """
+    types, ids, tagged, offsets, facilities = [], [], [], [0], []
+    building_ids, vertex_counts, vertex_lats, vertex_lons, heights = [], [], [], [], []
+    blob = bytearray()
+
+    for element in stream.feed_bytes(data, final):
+        encoded = orjson.dumps(element)
+        blob.extend(encoded)
+        offsets.append(len(blob))
+        types.append(ELEMENT_TYPES.index(element.get("type", "node")))
+        ids.append(element.get("id", 0))
+        tagged.append("tags" in element)
+        facility = extract_facility(element, lat, lon)
+        if facility is not None:
+            facilities.append(facility)
+
+        tags = element.get("tags")
+        geometry = element.get("geometry")
+        if tags and "building" in tags and "height" in tags and geometry and element["type"] == "way":
+            building_ids.append(element["id"])
+            vertex_counts.append(len(geometry))
+            vertex_lats.extend(point["lat"] for point in geometry)
+            vertex_lons.extend(point["lon"] for point in geometry)
+            heights.append(parse_height(tags["height"]))
+    if final:
+        stream.close()
+
+    return stream, ParsedOverpass(
+        stream.header, stream.remark,
+        np.array(types, dtype=np.uint8), np.array(ids, dtype=np.int64), np.array(tagged, dtype=bool),
+        np.array(offsets, dtype=np.int64), bytes(blob), facilities,
+        footprint_arrays(building_ids, vertex_counts, vertex_lats, vertex_lons, heights)
+    )
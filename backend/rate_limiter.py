@@ -0,0 +1,144 @@
+"""
+Per-upstream token-bucket rate limiting with a bounded priority admission queue.
+
+Callers await acquire("groq") before hitting an upstream. When no token is free the
+caller waits in a priority queue; if the queue is full or the wait exceeds its
+deadline, UpstreamOverloaded is raised and surfaced to the client as a 503.
+
+Waiters at PRIORITY_LOW (bulk requests, the alert evaluator) are served last and are not
+counted in queue_depths(), so background work cannot push the load governor into shedding.
+
+The limits in UPSTREAM_RATE_LIMITS are for the whole host and are split evenly between
+the WORKERS processes, so together they stay within each upstream's quota.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+from config import UPSTREAM_RATE_LIMITS, UPSTREAM_MAX_QUEUE, UPSTREAM_MAX_WAIT, WORKERS
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2  # batch and background work, served after interactive requests
+
+# Priority of the request being served; set at ingress and inherited by its tasks
+request_priority: ContextVar[int] = ContextVar("request_priority", default=PRIORITY_NORMAL)
+
+
+class UpstreamOverloaded(Exception):
+    """Raised when a request cannot be admitted to an upstream in time"""
+
+    def __init__(self, upstream: str, reason: str):
+        self.upstream = upstream
+        self.reason = reason
+        super().__init__(f"{upstream} is overloaded ({reason}), please retry later")
+
+
+class UpstreamLimiter:
+    def __init__(self, name: str, rate: float, burst: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.tokens = float(burst)
+        self.waiting = 0
+        self.waiting_low = 0
+        self._updated = time.monotonic()
+        self._heap = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, priority: Optional[int] = None):
+        """Wait for a token, highest priority first; raise UpstreamOverloaded when shed"""
+        self._refill()
+        if not self.waiting and self.tokens >= 1:
+            self.tokens -= 1
+            return
+
+        if self.waiting >= self.max_queue:
+            raise UpstreamOverloaded(self.name, "admission queue full")
+
+        if priority is None:
+            priority = request_priority.get()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._sequence), future))
+        self._count_waiter(priority, 1)
+        self._schedule()
+
+        try:
+            await asyncio.wait_for(future, timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            raise UpstreamOverloaded(self.name, f"waited more than {self.max_wait:.0f}s")
+        finally:
+            if future.cancelled():
+                self._count_waiter(priority, -1)
+
+    def _count_waiter(self, priority: int, change: int):
+        self.waiting += change
+        if priority >= PRIORITY_LOW:
+            self.waiting_low += change
+
+    def seconds_until(self, tokens: float) -> float:
+        """Time until `tokens` tokens have been available, if nobody else takes any"""
+        self._refill()
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+    def _schedule(self):
+        if self._timer is None and self._heap:
+            delay = max(0.0, (1 - self.tokens) / self.rate)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._release)
+
+    def _release(self):
+        self._timer = None
+        self._refill()
+        while self._heap and self.tokens >= 1:
+            priority, _, future = heapq.heappop(self._heap)
+            if future.done():
+                continue  # timed out or cancelled while queued
+            self.tokens -= 1
+            self._count_waiter(priority, -1)
+            future.set_result(None)
+        while self._heap and self._heap[0][2].done():
+            heapq.heappop(self._heap)
+        self._schedule()
+
+
+_limiters: Dict[str, UpstreamLimiter] = {
+    name: UpstreamLimiter(
+        name, limits["rate"] / WORKERS, max(1, limits["burst"] // WORKERS), UPSTREAM_MAX_QUEUE, UPSTREAM_MAX_WAIT)
+    for name, limits in UPSTREAM_RATE_LIMITS.items()
+}
+
+
+async def acquire(upstream: str):
+    """Take a request slot for the named upstream (see UPSTREAM_RATE_LIMITS)"""
+    await _limiters[upstream].acquire()
+
+
+def burst(upstream: str) -> int:
+    """Requests this worker may send to the named upstream back to back"""
+    return _limiters[upstream].burst
+
+
+def seconds_for(upstream: str, calls: int) -> float:
+    """Time this worker needs before `calls` requests to the named upstream can all be admitted"""
+    return _limiters[upstream].seconds_until(calls)
+
+
+async def pace(upstream: str, calls: int):
+    """Wait until a wave of `calls` requests (at most the burst) can go out without queueing"""
+    limiter = _limiters[upstream]
+    await asyncio.sleep(limiter.seconds_until(min(calls, limiter.burst)))
+
+
+def queue_depths() -> Dict[str, int]:
+    """Number of interactive requests currently waiting for each upstream"""
+    return {name: limiter.waiting - limiter.waiting_low for name, limiter in _limiters.items()}
@@ -0,0 +1,306 @@
+"""
+Typed internal records for upstream data.
+
+Weather, geography and location responses are read into these slotted records once, at the
+upstream boundary in weather_service and geographic_service, and the raw JSON is dropped.
+The rule engine, the prompt builders, the alert evaluator and the caches work on the
+records; to_dict() gives the public JSON form used in API responses and the shared cache,
+and from_dict() reads it back. Terrain and climate zones are small integer codes, so the
+vectorized classifiers return uint8 arrays and scalar lookups compare enum members.
+"""
+import numpy as np
+from enum import IntEnum
+from typing import Dict, Any, List, Optional
+
+
+class Terrain(IntEnum):
+    """Terrain class by elevation (see geographic_service.classify_terrain)"""
+    PLAIN = 0
+    COASTAL_PLAIN = 1
+    PLATEAU = 2
+    HILL = 3
+    MOUNTAIN = 4
+    HIGH_MOUNTAIN = 5
+
+    @property
+    def label(self) -> str:
+        return self.name.lower()
+
+    @property
+    def mountainous(self) -> bool:
+        return self >= Terrain.MOUNTAIN
+
+    @classmethod
+    def from_label(cls, label: str) -> "Terrain":
+        return cls[label.upper()]
+
+
+class ClimateZone(IntEnum):
+    """Climate zone of Indian coordinates (see geographic_service.get_climate_zone)"""
+    TROPICAL_WET = 0
+    TROPICAL_WET_DRY = 1
+    HOT_SEMI_ARID = 2
+    HOT_ARID = 3
+    HUMID_SUBTROPICAL = 4
+    ALPINE = 5
+    MONTANE = 6
+    TROPICAL_COASTAL = 7
+    ISLAND_TROPICAL = 8
+    SUBTROPICAL = 9
+
+    @property
+    def label(self) -> str:
+        return self.name.lower()
+
+    @classmethod
+    def from_label(cls, label: str) -> "ClimateZone":
+        return cls[label.upper()]
+
+
+# Code -> public label, for mapping the uint8 arrays of the vectorized classifiers
+TERRAIN_LABELS = np.array([terrain.label for terrain in Terrain])
+CLIMATE_LABELS = np.array([zone.label for zone in ClimateZone])
+
+
+class WeatherObservation:
+    """
+    Current conditions from OpenWeather: temp in °C, humidity in %, pressure in hPa,
+    wind in m/s, rain in mm over the last hour. Missing values get the rule engine defaults;
+    humidity stays None as no rule uses it.
+    """
+    __slots__ = ("temp", "humidity", "pressure", "wind_speed", "rain_1h", "description")
+
+    def __init__(self, temp: float = 25.0, humidity: Optional[float] = None, pressure: float = 1013.0,
+                 wind_speed: float = 0.0, rain_1h: float = 0.0, description: str = "N/A"):
+        self.temp = temp
+        self.humidity = humidity
+        self.pressure = pressure
+        self.wind_speed = wind_speed
+        self.rain_1h = rain_1h
+        self.description = description
+
+    @classmethod
+    def from_openweather(cls, current: Dict[str, Any]) -> "WeatherObservation":
+        main = current.get("main", {})
+        return cls(
+            main.get("temp", 25.0),
+            main.get("humidity"),
+            main.get("pressure", 1013.0),
+            current.get("wind", {}).get("speed", 0.0),
+            current.get("rain", {}).get("1h", 0.0),
+            (current.get("weather") or [{}])[0].get("description", "N/A")
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "WeatherObservation":
+        return cls(**data)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class ForecastFeatures:
+    """Derived forecast features used by the rule engine and the LLM prompt; all zero without a forecast"""
+    __slots__ = ("available", "max_rain_24h", "max_rain_72h", "max_pressure_drop_3h",
+                 "min_pressure", "peak_wind", "max_temp")
+
+    def __init__(self, max_rain_24h: float = 0.0, max_rain_72h: float = 0.0, max_pressure_drop_3h: float = 0.0,
+                 min_pressure: float = 0.0, peak_wind: float = 0.0, max_temp: float = 0.0, available: bool = False):
+        self.available = available
+        self.max_rain_24h = max_rain_24h
+        self.max_rain_72h = max_rain_72h
+        self.max_pressure_drop_3h = max_pressure_drop_3h
+        self.min_pressure = min_pressure
+        self.peak_wind = peak_wind
+        self.max_temp = max_temp
+
+
+NO_FORECAST = ForecastFeatures()
+
+
+class ForecastSeries:
+    """
+    The OpenWeather 5-day/3-hour forecast as compact columns, one entry per 3-hour step.
+
+    time is unix seconds; temp in °C, wind in m/s, rain in mm per 3 hours, pressure in hPa.
+    """
+    __slots__ = ("time", "temp", "wind", "rain", "pressure")
+
+    COLUMNS = ("time", "temp", "wind", "rain", "pressure")
+    STEP_HOURS = 3
+
+    def __init__(self, time, temp, wind, rain, pressure):
+        self.time = np.asarray(time, dtype=np.int64)
+        self.temp = np.asarray(temp, dtype=np.float32)
+        self.wind = np.asarray(wind, dtype=np.float32)
+        self.rain = np.asarray(rain, dtype=np.float32)
+        self.pressure = np.asarray(pressure, dtype=np.float32)
+
+    @classmethod
+    def empty(cls) -> "ForecastSeries":
+        return cls([], [], [], [], [])
+
+    @classmethod
+    def from_openweather(cls, forecast_data: Dict[str, Any]) -> "ForecastSeries":
+        entries = forecast_data.get("list", [])
+        return cls(
+            [entry.get("dt", 0) for entry in entries],
+            [entry.get("main", {}).get("temp", np.nan) for entry in entries],
+            [entry.get("wind", {}).get("speed", 0) for entry in entries],
+            [entry.get("rain", {}).get("3h", 0) for entry in entries],
+            [entry.get("main", {}).get("pressure", np.nan) for entry in entries],
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, List]) -> "ForecastSeries":
+        return cls(*(data[column] for column in cls.COLUMNS))
+
+    def to_dict(self) -> Dict[str, List]:
+        """JSON-friendly form used by the shared cache"""
+        return {
+            "time": self.time.tolist(),
+            **{column: np.round(getattr(self, column).astype(np.float64), 2).tolist() for column in self.COLUMNS[1:]}
+        }
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    def features(self) -> ForecastFeatures:
+        if not len(self):
+            return NO_FORECAST
+
+        return ForecastFeatures(
+            max_rain_24h=round(float(_max_window_sum(self.rain, 24 // self.STEP_HOURS)), 1),
+            max_rain_72h=round(float(_max_window_sum(self.rain, 72 // self.STEP_HOURS)), 1),
+            max_pressure_drop_3h=round(max(0.0, _nan_reduce(
+                np.nanmax, self.pressure[:-1] - self.pressure[1:], NO_FORECAST.max_pressure_drop_3h)), 1),
+            min_pressure=round(_nan_reduce(np.nanmin, self.pressure, NO_FORECAST.min_pressure), 1),
+            peak_wind=round(_nan_reduce(np.nanmax, self.wind, NO_FORECAST.peak_wind), 1),
+            max_temp=round(_nan_reduce(np.nanmax, self.temp, NO_FORECAST.max_temp), 1),
+            available=True
+        )
+
+
+def _nan_reduce(reduce, values: np.ndarray, default: float) -> float:
+    """reduce (np.nanmin/np.nanmax) over values, or default when every entry is missing"""
+    if np.isnan(values).all():
+        return default
+    return float(reduce(values))
+
+
+def _max_window_sum(values: np.ndarray, window: int) -> float:
+    """Largest sum over any `window` consecutive entries (or the total for shorter series)"""
+    if len(values) <= window:
+        return float(values.sum())
+    totals = np.cumsum(values, dtype=np.float64)
+    return float(np.max(np.concatenate([[totals[window - 1]], totals[window:] - totals[:-window]])))
+
+
+class WeatherReport:
+    """Current conditions plus the forecast for one "weather" cell; source is "openweather" or "fallback" """
+    __slots__ = ("observation", "forecast", "features", "timestamp", "source")
+
+    def __init__(self, observation: WeatherObservation, forecast: ForecastSeries, timestamp: str,
+                 source: str = "openweather"):
+        self.observation = observation
+        self.forecast = forecast
+        self.features = forecast.features()
+        self.timestamp = timestamp
+        self.source = source
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "WeatherReport":
+        return cls(
+            WeatherObservation.from_dict(data["observation"]),
+            ForecastSeries.from_dict(data["forecast"]),
+            data["timestamp"],
+            data.get("source", "openweather")
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Shared cache form; the forecast features are recomputed on load"""
+        return {
+            "observation": self.observation.to_dict(),
+            "forecast": self.forecast.to_dict(),
+            "timestamp": self.timestamp,
+            "source": self.source
+        }
+
+
+class GeoFeatures:
+    """
+    Geography of one "geo" cell: elevation in metres, terrain, IS 1893 seismic zone (2-5) and
+    climate zone, plus the building exposure computed by /buildings-emergency when known.
+    source is the elevation provider ("open-meteo") or "fallback".
+    """
+    __slots__ = ("elevation", "terrain", "seismic_zone", "climate_zone", "source", "building_exposure")
+
+    def __init__(self, elevation: float, terrain: Terrain, seismic_zone: int, climate_zone: ClimateZone,
+                 source: str, building_exposure: Optional[Dict[str, Any]] = None):
+        self.elevation = elevation
+        self.terrain = terrain
+        self.seismic_zone = seismic_zone
+        self.climate_zone = climate_zone
+        self.source = source
+        self.building_exposure = building_exposure
+
+    def with_exposure(self, exposure: Dict[str, Any]) -> "GeoFeatures":
+        """A copy with building exposure attached; cached records are shared and never modified"""
+        return GeoFeatures(self.elevation, self.terrain, self.seismic_zone, self.climate_zone, self.source, exposure)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "GeoFeatures":
+        return cls(
+            data["elevation"],
+            Terrain.from_label(data["terrain"]),
+            data["seismic_zone"],
+            ClimateZone.from_label(data["climate_zone"]),
+            data.get("source") or data.get("raw_data", {}).get("source", "open-meteo"),
+            data.get("building_exposure")
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Public form, as returned in geographic_data"""
+        data = {
+            "elevation": self.elevation,
+            "terrain": self.terrain.label,
+            "seismic_zone": self.seismic_zone,
+            "climate_zone": self.climate_zone.label,
+            "source": self.source
+        }
+        if self.building_exposure is not None:
+            data["building_exposure"] = self.building_exposure
+        return data
+
+
+class LocationInfo:
+    """Reverse-geocoded place names for one "location" cell"""
+    __slots__ = ("city", "state", "district", "country", "postal_code", "locality")
+
+    def __init__(self, city: str = "Unknown", state: str = "Unknown", district: str = "Unknown",
+                 country: str = "India", postal_code: str = "", locality: str = ""):
+        self.city = city
+        self.state = state
+        self.district = district
+        self.country = country
+        self.postal_code = postal_code
+        self.locality = locality
+
+    @classmethod
+    def from_bigdatacloud(cls, data: Dict[str, Any]) -> "LocationInfo":
+        return cls(
+            data.get("city", "Unknown"),
+            data.get("principalSubdivision", "Unknown"),
+            data.get("localityInfo", {}).get("administrative", [{}])[0].get("name", "Unknown"),
+            data.get("countryName", "India"),
+            data.get("postcode", ""),
+            data.get("locality", "")
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LocationInfo":
+        return cls(**{name: data[name] for name in cls.__slots__ if name in data})
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Public form, as returned in location_info"""
+        return {name: getattr(self, name) for name in self.__slots__}
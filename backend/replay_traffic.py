@@ -0,0 +1,76 @@
+"""
+Re-drive captured traffic against a SafeRoute server.
+
+Start the target with its upstream calls served from the same log, e.g.
+
+    TRAFFIC_REPLAY_PATH=traffic.jsonl.gz CACHE_DB_PATH= uvicorn main:app --port 8001
+
+(an empty CACHE_DB_PATH disables the shared cache so every request hits the replayed
+upstreams, which answer after their recorded latency unless TRAFFIC_REPLAY_LATENCY=0), then replay the recorded inbound requests at their original pacing:
+
+    python replay_traffic.py traffic.jsonl.gz --target http://localhost:8001 --speed 4
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+import httpx
+from traffic_capture import read_log
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def replay(path: str, target: str, speed: float, concurrency: int):
+    requests = sorted((r for r in read_log(path) if r["kind"] == "request"), key=lambda r: r["t"])
+    if not requests:
+        raise SystemExit("No captured requests in log")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses, mismatches = [], Counter(), 0
+    origin = requests[0]["t"]
+    started = time.perf_counter()
+
+    async with httpx.AsyncClient(base_url=target, timeout=180.0) as client:
+        async def send(record):
+            nonlocal mismatches
+            if speed > 0:
+                await asyncio.sleep(max(0.0, (record["t"] - origin) / speed - (time.perf_counter() - started)))
+            async with semaphore:
+                sent = time.perf_counter()
+                try:
+                    response = await client.request(
+                        record["method"],
+                        record["path"] + (f"?{record['query']}" if record["query"] else ""),
+                        content=record["body"].encode(),
+                        headers={"Content-Type": record["content_type"] or "application/json"}
+                    )
+                    status = response.status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append((time.perf_counter() - sent) * 1000)
+                statuses[status] += 1
+                if status != record["status"]:
+                    mismatches += 1
+
+        await asyncio.gather(*(send(record) for record in requests))
+
+    elapsed = time.perf_counter() - started
+    print(f"Replayed {len(requests)} requests in {elapsed:.1f}s "
+          f"(recorded span {requests[-1]['t'] - origin:.1f}s, speed {'max' if speed <= 0 else f'{speed}x'})")
+    print(f"Latency ms: p50 {_percentile(latencies, 0.5):.0f}  p95 {_percentile(latencies, 0.95):.0f}  "
+          f"p99 {_percentile(latencies, 0.99):.0f}  mean {statistics.mean(latencies):.0f}")
+    print(f"Statuses: {dict(statuses)}  (differing from capture: {mismatches})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-drive captured SafeRoute traffic")
+    parser.add_argument("log", help="capture log written with TRAFFIC_CAPTURE_PATH")
+    parser.add_argument("--target", default="http://localhost:8000")
+    parser.add_argument("--speed", type=float, default=1.0, help="time acceleration factor; 0 sends as fast as possible")
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+    asyncio.run(replay(args.log, args.target, args.speed, args.concurrency))
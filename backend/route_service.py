@@ -0,0 +1,111 @@
+import asyncio
+import numpy as np
+from typing import Dict, Any, List
+from config import CELL_PRECISION, ROUTE_MAX_WEATHER_SECONDS
+from weather_service import get_weather_data_many
+from geographic_service import get_elevations, classify_terrain_array, get_seismic_zones, get_climate_zones
+from records import Terrain, TERRAIN_LABELS, CLIMATE_LABELS
+from utils import (
+    calculate_haversine_distance_array, calculate_rule_based_probability_array, get_risk_level,
+    encode_cells, decode_cells
+)
+
+
+def sample_polyline(polyline: np.ndarray, spacing_m: float):
+    """
+    Sample a (n, 2) lat/lon polyline every spacing_m metres, always including the end point.
+    Returns (latitudes, longitudes, distances along the route in km).
+    """
+    step_km = calculate_haversine_distance_array(
+        polyline[:-1, 0], polyline[:-1, 1], polyline[1:, 0], polyline[1:, 1])
+    cumulative = np.concatenate([[0.0], np.cumsum(step_km)])
+    total = cumulative[-1]
+
+    distances = np.append(np.arange(0.0, total, spacing_m / 1000.0), total)
+    lats = np.interp(distances, cumulative, polyline[:, 0])
+    lons = np.interp(distances, cumulative, polyline[:, 1])
+    return lats, lons, distances
+
+
+async def assess_route_risk(polyline: List[List[float]], spacing_m: float) -> Dict[str, Any]:
+    """
+    Rule-based risk along a route corridor.
+
+    The route is sampled every spacing_m metres and samples are deduplicated into "route"
+    cells. Elevation is fetched in batches, terrain, seismic and climate zones are computed
+    per cell in one vectorized pass, and weather is fetched once per enclosing
+    "route_weather" cell (~39 x 20 km), at the weather cell in its centre, so even long
+    routes need only a few OpenWeather calls. Consecutive samples in the same cell form a
+    segment.
+    """
+    points = np.asarray(polyline, dtype=float)
+    lats, lons, distances = sample_polyline(points, spacing_m)
+
+    cells, sample_cell = np.unique(encode_cells(lats, lons, CELL_PRECISION["route"]), return_inverse=True)
+    sample_cell = sample_cell.ravel()
+    cell_lats, cell_lons = decode_cells(cells)
+
+    # Weather cells are the route cells' ancestors (geohash prefixes)
+    weather_cells, cell_weather = np.unique(cells.astype(f"U{CELL_PRECISION['route_weather']}"), return_inverse=True)
+    cell_weather = cell_weather.ravel()
+    weather_lats, weather_lons = decode_cells(weather_cells)
+
+    elevations, weather = await asyncio.gather(
+        get_elevations(cell_lats, cell_lons),
+        get_weather_data_many(list(zip(weather_lats, weather_lons)), ROUTE_MAX_WEATHER_SECONDS)
+    )
+
+    current = [w.observation for w in weather]
+    temp = np.array([c.temp for c in current], dtype=float)[cell_weather]
+    wind = np.array([c.wind_speed for c in current], dtype=float)[cell_weather]
+    rain = np.array([c.rain_1h for c in current], dtype=float)[cell_weather]
+    pressure = np.array([c.pressure for c in current], dtype=float)[cell_weather]
+    forecast = [w.features for w in weather]
+    rain_24h = np.array([f.max_rain_24h for f in forecast], dtype=float)[cell_weather]
+    peak_wind = np.array([f.peak_wind for f in forecast], dtype=float)[cell_weather]
+    pressure_drop = np.array([f.max_pressure_drop_3h for f in forecast], dtype=float)[cell_weather]
+
+    terrain = classify_terrain_array(elevations)
+    seismic = get_seismic_zones(cell_lats, cell_lons)
+    climate = get_climate_zones(cell_lats, cell_lons)
+    probability = calculate_rule_based_probability_array(
+        temp, wind, rain, pressure, seismic, terrain >= Terrain.MOUNTAIN,
+        rain_24h, peak_wind, pressure_drop)
+
+    # Segment boundaries: wherever consecutive samples change cell
+    starts = np.flatnonzero(np.concatenate([[True], sample_cell[1:] != sample_cell[:-1]]))
+    ends = np.append(starts[1:], len(sample_cell)) - 1
+
+    segments = []
+    for start, end in zip(starts, ends):
+        cell = sample_cell[start]
+        segments.append({
+            "cell": str(cells[cell]),
+            "start": {"latitude": float(lats[start]), "longitude": float(lons[start]), "distance_km": round(float(distances[start]), 3)},
+            "end": {"latitude": float(lats[end]), "longitude": float(lons[end]), "distance_km": round(float(distances[end]), 3)},
+            "probability": float(probability[cell]),
+            "risk_level": get_risk_level(probability[cell]),
+            "elevation": float(elevations[cell]),
+            "terrain": str(TERRAIN_LABELS[terrain[cell]]),
+            "seismic_zone": int(seismic[cell]),
+            "climate_zone": str(CLIMATE_LABELS[climate[cell]]),
+            "weather": {
+                "temp": float(temp[cell]),
+                "wind_speed": float(wind[cell]),
+                "rain_1h": float(rain[cell]),
+                "pressure": float(pressure[cell]),
+                "forecast_max_rain_24h": float(rain_24h[cell]),
+                "forecast_peak_wind": float(peak_wind[cell])
+            }
+        })
+
+    worst = max(range(len(segments)), key=lambda i: segments[i]["probability"])
+    return {
+        "route_length_km": round(float(distances[-1]), 3),
+        "samples": len(lats),
+        "cells": len(cells),
+        "weather_cells": len(weather_cells),
+        "segments": segments,
+        "worst_segment_index": worst,
+        "worst_segment": segments[worst]
+    }
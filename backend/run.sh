@@ -1,4 +1,10 @@
 #!/bin/bash
 # Development server startup script
+# Set WORKERS>1 to run several worker processes; they share the SQLite cache (cache_store.py)
+# and alert subscriptions (subscription_store.py)
 echo "Starting SafeRoute FastAPI server..."
-uvicorn main:app --host 0.0.0.0 --port 8000 --reload
+if [ "${WORKERS:-1}" -gt 1 ]; then
+    uvicorn main:app --host 0.0.0.0 --port 8000 --workers "$WORKERS"
+else
+    uvicorn main:app --host 0.0.0.0 --port 8000 --reload
+fi
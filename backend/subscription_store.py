@@ -0,0 +1,102 @@
+"""
+Alert subscriptions shared by all workers on the host.
+
+Subscriptions are kept in the alert_subscriptions table of the SQLite database behind
+cache_store (CACHE_DB_PATH), so a subscription created through one worker can be
+delivered over a WebSocket held by another and deleted through a third. The table is
+never evicted. All access runs in a thread, off the event loop. Without CACHE_DB_PATH
+the store is disabled and subscriptions live only in the worker that accepted them.
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+from config import CACHE_DB_PATH
+
+# id, client_id, cell, latitude, longitude, threshold
+SubscriptionRow = Tuple[str, str, str, float, float, float]
+
+_connection: Optional[sqlite3.Connection] = None
+_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return bool(CACHE_DB_PATH)
+
+
+def _get_connection() -> sqlite3.Connection:
+    global _connection
+    if _connection is None:
+        _connection = sqlite3.connect(CACHE_DB_PATH, timeout=5.0, check_same_thread=False, isolation_level=None)
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.execute("PRAGMA busy_timeout=5000")
+        _connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS alert_subscriptions (
+                id TEXT PRIMARY KEY,
+                client_id TEXT NOT NULL,
+                cell TEXT NOT NULL,
+                latitude REAL NOT NULL,
+                longitude REAL NOT NULL,
+                threshold REAL NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        _connection.execute(
+            "CREATE INDEX IF NOT EXISTS alert_subscriptions_client ON alert_subscriptions (client_id)")
+    return _connection
+
+
+def _insert(row: SubscriptionRow, max_per_client: int) -> bool:
+    with _lock:
+        connection = _get_connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            owned = connection.execute(
+                "SELECT COUNT(*) FROM alert_subscriptions WHERE client_id = ?", (row[1],)).fetchone()[0]
+            if owned >= max_per_client:
+                return False
+            connection.execute(
+                "INSERT INTO alert_subscriptions (id, client_id, cell, latitude, longitude, threshold, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", (*row, time.time()))
+            return True
+        finally:
+            connection.execute("COMMIT")
+
+
+def _delete(subscription_id: str, client_id: str) -> bool:
+    with _lock:
+        cursor = _get_connection().execute(
+            "DELETE FROM alert_subscriptions WHERE id = ? AND client_id = ?", (subscription_id, client_id))
+        return cursor.rowcount > 0
+
+
+def _select() -> List[SubscriptionRow]:
+    with _lock:
+        return _get_connection().execute(
+            "SELECT id, client_id, cell, latitude, longitude, threshold FROM alert_subscriptions").fetchall()
+
+
+async def add_subscription(row: SubscriptionRow, max_per_client: int) -> bool:
+    """Store a subscription; False when its client already has max_per_client"""
+    return await asyncio.to_thread(_insert, row, max_per_client)
+
+
+async def remove_subscription(subscription_id: str, client_id: str) -> bool:
+    """Delete a subscription owned by client_id; False if there is none"""
+    return await asyncio.to_thread(_delete, subscription_id, client_id)
+
+
+async def load_subscriptions() -> List[SubscriptionRow]:
+    """Every subscription on the host"""
+    return await asyncio.to_thread(_select)
+
+
+def close_store():
+    global _connection
+    with _lock:
+        if _connection is not None:
+            _connection.close()
+            _connection = None
@@ -0,0 +1,70 @@
+"""
+Per-connection state for live position tracking.
+
+A traveller's prediction only needs recomputing when they move into another grid
+cell, when fresh weather arrives for their cell, or when the prediction gets older
+than TRACK_MAX_AGE. Everything else is answered with a cheap acknowledgement.
+"""
+import time
+from typing import Dict, Optional
+from config import TRACK_MAX_AGE, CELL_PRECISION
+from weather_service import add_weather_refresh_listener
+from records import WeatherReport
+from utils import encode_cell, parent_cell
+
+# Data version per weather cell containing at least one tracker, bumped on weather refresh
+_cell_versions: Dict[str, int] = {}
+_cell_trackers: Dict[str, int] = {}
+
+
+def _on_weather_refresh(weather_cell: str, weather_data: WeatherReport):
+    if weather_cell in _cell_versions:
+        _cell_versions[weather_cell] += 1
+
+
+add_weather_refresh_listener(_on_weather_refresh)
+
+
+class TrackingSession:
+    __slots__ = ("cell", "weather_cell", "version", "evaluated_at", "fixes", "evaluations")
+
+    def __init__(self):
+        self.cell: Optional[str] = None  # "track" cell
+        self.weather_cell: Optional[str] = None  # its ancestor at "weather" precision
+        self.version = 0
+        self.evaluated_at = 0.0
+        self.fixes = 0
+        self.evaluations = 0
+
+    def needs_evaluation(self, lat: float, lon: float) -> bool:
+        """Record a GPS fix and report whether the prediction must be recomputed"""
+        self.fixes += 1
+        cell = encode_cell(lat, lon, CELL_PRECISION["track"])
+        if cell != self.cell:
+            self._move_to(cell)
+            return True
+        return _cell_versions[self.weather_cell] != self.version or time.time() - self.evaluated_at >= TRACK_MAX_AGE
+
+    def mark_evaluated(self):
+        self.version = _cell_versions[self.weather_cell]
+        self.evaluated_at = time.time()
+        self.evaluations += 1
+
+    def _move_to(self, cell: str):
+        self.close()
+        self.cell = cell
+        self.weather_cell = parent_cell(cell, CELL_PRECISION["weather"])
+        _cell_trackers[self.weather_cell] = _cell_trackers.get(self.weather_cell, 0) + 1
+        _cell_versions.setdefault(self.weather_cell, 0)
+        self.version = -1  # force evaluation in the new cell
+
+    def close(self):
+        if self.cell is None:
+            return
+        remaining = _cell_trackers[self.weather_cell] - 1
+        if remaining:
+            _cell_trackers[self.weather_cell] = remaining
+        else:
+            del _cell_trackers[self.weather_cell]
+            del _cell_versions[self.weather_cell]
+        self.cell = self.weather_cell = None
@@ -0,0 +1,295 @@
+"""
+Opt-in traffic capture and deterministic upstream replay.
+
+With TRAFFIC_CAPTURE_PATH set, requests to TRAFFIC_CAPTURE_PATHS and every upstream
+call they trigger are appended to a gzip-compressed JSON-lines log. Each flush appends
+a complete gzip member under an exclusive file lock, so several workers can share one
+log and gzip.open() reads it back as a single stream. Serializing, compressing and
+writing happen on a writer thread, off the event loop.
+
+With TRAFFIC_REPLAY_PATH set, upstream HTTP calls (weather, geo, Overpass, Groq) are
+answered from a recorded log instead of the network; replay_traffic.py re-drives the
+recorded inbound requests against such a server.
+"""
+import asyncio
+import base64
+import fcntl
+import gzip
+import hashlib
+import io
+import json
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import httpx
+from config import (
+    TRAFFIC_CAPTURE_PATH, TRAFFIC_REPLAY_PATH, TRAFFIC_REPLAY_LATENCY, TRAFFIC_CAPTURE_PATHS, TRAFFIC_CAPTURE_FLUSH_EVERY
+)
+
+# Query parameters holding credentials are never written to the log
+_SECRET_PARAMS = {"appid", "key", "api_key", "apikey", "token"}
+
+# Trace id of the inbound request being served, linking upstream records to it
+current_trace: ContextVar[Optional[str]] = ContextVar("current_trace", default=None)
+
+# Date, time and season lines in LLM prompts; left out of the request hash so a log
+# recorded on another day still matches
+_CLOCK_PATTERN = re.compile(rb"(Date: \d{4}-\d{2}-\d{2}(?: \([^)]*\))?|Time: \d{2}:\d{2}:\d{2}|Season: [A-Za-z-]+)")
+
+_writer: Optional["_CaptureWriter"] = None
+_writer_lock = threading.Lock()
+
+
+def _redact_url(url: str) -> str:
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k.lower() not in _SECRET_PARAMS]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+
+def _request_hash(content: bytes) -> str:
+    return hashlib.sha1(_CLOCK_PATTERN.sub(b"", content)).hexdigest()
+
+
+class _CaptureWriter(threading.Thread):
+    """Serializes queued records and appends them as one gzip member per TRAFFIC_CAPTURE_FLUSH_EVERY"""
+
+    _STOP = object()
+
+    def __init__(self):
+        super().__init__(name="capture-writer", daemon=True)
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+
+    def put(self, record: Dict):
+        self._queue.put(record)
+
+    def stop(self):
+        self._queue.put(self._STOP)
+        self.join()
+
+    def run(self):
+        lines: List[str] = []
+        while True:
+            record = self._queue.get()
+            if record is self._STOP:
+                break
+            lines.append(json.dumps(record, separators=(",", ":")))
+            if len(lines) >= TRAFFIC_CAPTURE_FLUSH_EVERY:
+                self._append(lines)
+                lines = []
+        if lines:
+            self._append(lines)
+
+    @staticmethod
+    def _append(lines: List[str]):
+        member = io.BytesIO()
+        with gzip.GzipFile(fileobj=member, mode="wb") as compressed:
+            compressed.write(("\n".join(lines) + "\n").encode())
+        try:
+            with open(TRAFFIC_CAPTURE_PATH, "ab") as log:
+                fcntl.flock(log, fcntl.LOCK_EX)
+                try:
+                    log.write(member.getvalue())
+                finally:
+                    fcntl.flock(log, fcntl.LOCK_UN)
+        except OSError as e:
+            print(f"Traffic capture write error: {str(e)}")
+
+
+def _write(record: Dict):
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = _CaptureWriter()
+            _writer.start()
+        writer = _writer
+    writer.put(record)
+
+
+def flush_capture():
+    """Append any queued records and stop the writer; called on shutdown"""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.stop()
+
+
+def read_log(path: str) -> Iterator[Dict]:
+    with gzip.open(path, "rt") as log:
+        for line in log:
+            if line.strip():
+                yield json.loads(line)
+
+
+class _TeeStream(httpx.AsyncByteStream):
+    """Passes an upstream body through as it arrives and records the exchange once it is complete"""
+
+    def __init__(self, inner: httpx.AsyncByteStream, record: Dict, started: float):
+        self._inner = inner
+        self._record = record
+        self._started = started
+        self._chunks: List[bytes] = []
+
+    async def __aiter__(self):
+        async for chunk in self._inner:
+            self._chunks.append(chunk)
+            yield chunk
+        self._record["duration_ms"] = round((time.time() - self._started) * 1000, 1)
+        self._record["body"] = base64.b64encode(b"".join(self._chunks)).decode()
+        _write(self._record)
+
+    async def aclose(self):
+        # A body the client stopped reading is not recorded: it could not be replayed faithfully
+        await self._inner.aclose()
+
+
+class CaptureTransport(httpx.AsyncBaseTransport):
+    """Forwards to the network and records each exchange, without holding back streamed bodies"""
+
+    def __init__(self):
+        self._inner = httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.time()
+        response = await self._inner.handle_async_request(request)
+        record = {
+            "kind": "upstream",
+            "trace": current_trace.get(),
+            "t": started,
+            "duration_ms": None,
+            "method": request.method,
+            "url": _redact_url(str(request.url)),
+            "request_sha1": _request_hash(request.content),
+            "status": response.status_code,
+            "headers": [[k, v] for k, v in response.headers.items() if k.lower() != "set-cookie"],
+            "body": None
+        }
+        return httpx.Response(
+            response.status_code, headers=response.headers, stream=_TeeStream(response.stream, record, started),
+            request=request
+        )
+
+    async def aclose(self):
+        await self._inner.aclose()
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """
+    Serves upstream calls from a capture log.
+
+    A call is matched on method, redacted URL and a hash of the request body without the
+    date, time and season lines of LLM prompts, so every Groq call gets the response
+    recorded for the same prompt, whatever the day or the order calls arrive in. Unmatched
+    calls get a 404 (which the Groq SDK does not retry) so services take their fallback
+    paths. Matched calls take as long as the recorded call did (duration_ms) unless
+    TRAFFIC_REPLAY_LATENCY is off.
+    """
+
+    def __init__(self, path: str):
+        self._exact: Dict[tuple, deque] = defaultdict(deque)
+        for record in read_log(path):
+            if record["kind"] == "upstream":
+                self._exact[(record["method"], record["url"], record["request_sha1"])].append(record)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        url = _redact_url(str(request.url))
+        record = self._take(self._exact.get((request.method, url, _request_hash(request.content))))
+        if record is None:
+            return httpx.Response(404, json={"error": "no recorded response"}, request=request)
+        if TRAFFIC_REPLAY_LATENCY:
+            await asyncio.sleep(record["duration_ms"] / 1000)
+
+        return httpx.Response(
+            record["status"],
+            headers=[tuple(header) for header in record["headers"]],
+            content=base64.b64decode(record["body"]),
+            request=request
+        )
+
+    @staticmethod
+    def _take(records: Optional[deque]) -> Optional[Dict]:
+        """Next recorded response, repeating the last one once the queue runs out"""
+        if not records:
+            return None
+        return records.popleft() if len(records) > 1 else records[0]
+
+
+_replay_transport: Optional[ReplayTransport] = None
+
+
+def _transport() -> Optional[httpx.AsyncBaseTransport]:
+    global _replay_transport
+    if TRAFFIC_REPLAY_PATH:
+        if _replay_transport is None:
+            _replay_transport = ReplayTransport(TRAFFIC_REPLAY_PATH)
+        return _replay_transport
+    if TRAFFIC_CAPTURE_PATH:
+        return CaptureTransport()
+    return None
+
+
+def create_http_client(**kwargs) -> httpx.AsyncClient:
+    """httpx client for upstream calls; captures or replays them when enabled"""
+    transport = _transport()
+    if transport is not None:
+        kwargs["transport"] = transport
+    return httpx.AsyncClient(**kwargs)
+
+
+def groq_http_client() -> Optional[httpx.AsyncClient]:
+    """http_client for AsyncGroq; None keeps the SDK default when capture/replay is off"""
+    if TRAFFIC_CAPTURE_PATH or TRAFFIC_REPLAY_PATH:
+        return create_http_client(timeout=120.0)
+    return None
+
+
+class TrafficCaptureMiddleware:
+    """ASGI middleware recording inbound requests to TRAFFIC_CAPTURE_PATHS"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not TRAFFIC_CAPTURE_PATH or scope["type"] != "http" or scope["path"] not in TRAFFIC_CAPTURE_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        trace = uuid.uuid4().hex
+        token = current_trace.set(trace)
+        body = bytearray()
+        status = {"code": None}
+        started = time.time()
+
+        async def capture_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                body.extend(message.get("body", b""))
+            return message
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, capture_receive, capture_send)
+        finally:
+            current_trace.reset(token)
+            _write({
+                "kind": "request",
+                "trace": trace,
+                "t": started,
+                "duration_ms": round((time.time() - started) * 1000, 1),
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope["query_string"].decode(),
+                "content_type": dict(scope["headers"]).get(b"content-type", b"").decode(),
+                "body": body.decode("utf-8", errors="replace"),
+                "status": status["code"]
+            })
@@ -1,6 +1,8 @@
 import math
-from typing import Dict, Any
-from config import EARTH_RADIUS_KM
+import numpy as np
+from typing import Dict, Any, List, Optional, Tuple
+from config import EARTH_RADIUS_KM, CELL_PRECISION
+from records import WeatherReport, GeoFeatures, Terrain
 
 
 def calculate_haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
@@ -20,6 +22,13 @@ def calculate_haversine_distance(lat1: float, lon1: float, lat2: float, lon2: fl
     return c * EARTH_RADIUS_KM
 
 
+def calculate_haversine_distance_array(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Vectorized calculate_haversine_distance over NumPy arrays, in kilometers"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * np.arcsin(np.sqrt(a)) * EARTH_RADIUS_KM
+
+
 def get_risk_level(probability: float) -> str:
     """Convert probability to risk level"""
     if probability < 25:
@@ -32,71 +41,102 @@ def get_risk_level(probability: float) -> str:
         return "Critical"
 
 
-def calculate_rule_based_probability(weather_data: Dict, geo_data: Dict) -> float:
+def calculate_rule_based_probability(weather_data: WeatherReport, geo_data: GeoFeatures) -> float:
     """
     Calculate disaster probability using rules
     """
     base_probability = 10.0
-    current = weather_data.get("current", {})
+    current = weather_data.observation
 
-    temp = current.get("main", {}).get("temp", 25)
-    wind_speed = current.get("wind", {}).get("speed", 0)
-    rain = current.get("rain", {}).get("1h", 0)
-    pressure = current.get("main", {}).get("pressure", 1013)
-
-    if temp > 42:
+    if current.temp > 42:
         base_probability += 30
-    elif temp < 5:
+    elif current.temp < 5:
         base_probability += 20
 
-    if wind_speed > 20:
+    if current.wind_speed > 20:
         base_probability += 25
-    elif wind_speed > 15:
+    elif current.wind_speed > 15:
         base_probability += 15
 
-    if rain > 15:
+    if current.rain_1h > 15:
         base_probability += 35
-    elif rain > 5:
+    elif current.rain_1h > 5:
         base_probability += 15
 
-    if pressure < 995:
+    if current.pressure < 995:
         base_probability += 20
 
-    if geo_data["seismic_zone"] >= 4:
+    # Forecast features (see records.ForecastSeries.features)
+    forecast = weather_data.features
+    if forecast.max_rain_24h > 115:
+        base_probability += 20
+    elif forecast.max_rain_24h > 64:
+        base_probability += 10
+
+    if forecast.peak_wind > 17:
+        base_probability += 10
+
+    if forecast.max_pressure_drop_3h >= 3:
+        base_probability += 10
+
+    if geo_data.seismic_zone >= 4:
         base_probability += 15
 
-    if geo_data["terrain"] in ["mountain", "high_mountain"]:
+    if geo_data.terrain.mountainous:
         base_probability += 10
 
     return min(base_probability, 95.0)
 
 
-def get_primary_threats_rule_based(weather_data: Dict, geo_data: Dict) -> list[str]:
+def calculate_rule_based_probability_array(
+    temp: np.ndarray, wind_speed: np.ndarray, rain: np.ndarray, pressure: np.ndarray,
+    seismic_zone: np.ndarray, mountainous: np.ndarray,
+    rain_24h: np.ndarray = 0.0, peak_wind: np.ndarray = 0.0, pressure_drop_3h: np.ndarray = 0.0
+) -> np.ndarray:
+    """Vectorized calculate_rule_based_probability for many locations at once"""
+    probability = np.full(temp.shape, 10.0)
+    probability += np.select([temp > 42, temp < 5], [30, 20], 0)
+    probability += np.select([wind_speed > 20, wind_speed > 15], [25, 15], 0)
+    probability += np.select([rain > 15, rain > 5], [35, 15], 0)
+    probability += np.where(pressure < 995, 20, 0)
+    probability += np.select([rain_24h > 115, rain_24h > 64], [20, 10], 0)
+    probability += np.where(peak_wind > 17, 10, 0)
+    probability += np.where(pressure_drop_3h >= 3, 10, 0)
+    probability += np.where(seismic_zone >= 4, 15, 0)
+    probability += np.where(mountainous, 10, 0)
+    return np.minimum(probability, 95.0)
+
+
+def is_severe_weather(weather_data: WeatherReport) -> bool:
+    """Whether current conditions are severe enough to prioritise the request"""
+    current = weather_data.observation
+    return current.wind_speed > 15 or current.rain_1h > 10 or current.pressure < 995
+
+
+def get_primary_threats_rule_based(weather_data: WeatherReport, geo_data: GeoFeatures) -> list[str]:
     """Get primary threats based on conditions"""
     threats = []
-    current = weather_data.get("current", {})
+    current = weather_data.observation
+    forecast = weather_data.features
 
-    temp = current.get("main", {}).get("temp", 25)
-    wind_speed = current.get("wind", {}).get("speed", 0)
-    rain = current.get("rain", {}).get("1h", 0)
-
-    if temp > 40:
+    if current.temp > 40:
         threats.append("heat_wave")
-    if wind_speed > 15:
+    if current.wind_speed > 15:
         threats.append("high_winds")
-    if rain > 10:
+    if current.rain_1h > 10 or forecast.max_rain_24h > 64:
         threats.append("flooding")
-    if geo_data["seismic_zone"] >= 4:
+    if geo_data.seismic_zone >= 4:
         threats.append("earthquake")
-    if geo_data["terrain"] in ["coastal_plain"]:
+    if geo_data.terrain == Terrain.COASTAL_PLAIN or (
+            forecast.peak_wind > 17 and forecast.max_pressure_drop_3h >= 3):
         threats.append("cyclone")
-    if geo_data["terrain"] in ["mountain", "high_mountain"] and rain > 5:
+    if geo_data.terrain.mountainous and (current.rain_1h > 5 or forecast.max_rain_24h > 64):
         threats.append("landslide")
 
     return threats[:4] if threats else ["general_weather"]
 
 
-def get_recommendations_rule_based(probability: float, geo_data: Dict) -> list[str]:
+def get_recommendations_rule_based(probability: float, geo_data: GeoFeatures) -> list[str]:
     """Generate safety recommendations"""
     recommendations = [
         "Monitor official weather alerts",
@@ -119,3 +159,150 @@ def get_recommendations_rule_based(probability: float, geo_data: Dict) -> list[s
         ])
 
     return recommendations[:6]
+
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    """Split a ?fields= value (comma-separated dotted paths) into paths"""
+    if not fields:
+        return []
+    return [path.strip() for path in fields.split(",") if path.strip()]
+
+
+def project_fields(data: Dict, paths: List[str]) -> Dict:
+    """
+    Keep only the given dotted paths of a nested dict, e.g. ["analysis.conclusion", "location_info.city"].
+    Paths that do not exist are ignored.
+    """
+    result: Dict[str, Any] = {}
+    for path in paths:
+        source, target = data, result
+        parts = path.split(".")
+        for depth, part in enumerate(parts):
+            if not isinstance(source, dict) or part not in source:
+                break
+            if depth == len(parts) - 1:
+                target[part] = source[part]
+                break
+            if target.get(part) is source[part]:
+                break  # a shorter path already included the whole subtree
+            source = source[part]
+            target = target.setdefault(part, {})
+    return result
+
+
+# Geohash cell indexing
+#
+# Coordinates are canonicalized to geohash cells so requests a few metres apart share
+# cache entries and upstream calls. Each data source uses its own precision
+# (config.CELL_PRECISION); a cell's prefixes are its ancestors at coarser precisions.
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+_GEOHASH_CHARS = np.frombuffer(GEOHASH_ALPHABET.encode(), dtype=np.uint8)
+_GEOHASH_VALUES = np.full(256, -1, dtype=np.int64)
+_GEOHASH_VALUES[_GEOHASH_CHARS] = np.arange(32)
+
+
+def _geohash_bits(precision: int) -> Tuple[int, int]:
+    """(latitude bits, longitude bits) of a geohash with the given number of characters"""
+    bits = precision * 5
+    return bits // 2, bits - bits // 2
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """(latitude, longitude) extent in degrees of cells at a precision"""
+    lat_bits, lon_bits = _geohash_bits(precision)
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def encode_cells(lats, lons, precision: int) -> np.ndarray:
+    """Vectorized geohash encoding; returns an array of cell id strings"""
+    lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+    lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+    lat_bits, lon_bits = _geohash_bits(precision)
+
+    lat_q = np.clip(((lats + 90.0) / 180.0 * (1 << lat_bits)).astype(np.int64), 0, (1 << lat_bits) - 1)
+    lon_q = np.clip(((lons + 180.0) / 360.0 * (1 << lon_bits)).astype(np.int64), 0, (1 << lon_bits) - 1)
+
+    # Interleave starting with longitude: even bit positions (from the top) are longitude
+    code = np.zeros(lats.shape, dtype=np.int64)
+    for i in range(lat_bits + lon_bits):
+        if i % 2 == 0:
+            bit = (lon_q >> (lon_bits - 1 - i // 2)) & 1
+        else:
+            bit = (lat_q >> (lat_bits - 1 - i // 2)) & 1
+        code = (code << 1) | bit
+
+    shifts = 5 * np.arange(precision - 1, -1, -1)
+    chars = _GEOHASH_CHARS[(code[:, None] >> shifts) & 31]
+    return np.ascontiguousarray(chars).view(f"S{precision}").ravel().astype(f"U{precision}")
+
+
+def decode_cells(cells) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorized geohash decoding to cell centre (latitudes, longitudes); cells must share a precision"""
+    cells = np.atleast_1d(np.asarray(cells, dtype=str))
+    precision = len(cells[0]) if len(cells) else 0
+    if np.any(np.char.str_len(cells) != precision):
+        raise ValueError("decode_cells needs cells of a single precision")
+    lat_bits, lon_bits = _geohash_bits(precision)
+
+    values = _GEOHASH_VALUES[np.frombuffer(cells.astype(f"S{precision}").tobytes(), dtype=np.uint8)]
+    if np.any(values < 0):
+        raise ValueError("Invalid geohash character")
+    code = np.zeros(len(cells), dtype=np.int64)
+    for column in values.reshape(len(cells), precision).T:
+        code = (code << 5) | column
+
+    lat_q = np.zeros(len(cells), dtype=np.int64)
+    lon_q = np.zeros(len(cells), dtype=np.int64)
+    total = lat_bits + lon_bits
+    for i in range(total):
+        bit = (code >> (total - 1 - i)) & 1
+        if i % 2 == 0:
+            lon_q = (lon_q << 1) | bit
+        else:
+            lat_q = (lat_q << 1) | bit
+
+    lat_size, lon_size = cell_size(precision)
+    return (lat_q + 0.5) * lat_size - 90.0, (lon_q + 0.5) * lon_size - 180.0
+
+
+def encode_cell(lat: float, lon: float, precision: int) -> str:
+    return str(encode_cells(lat, lon, precision)[0])
+
+
+def decode_cell(cell: str) -> Tuple[float, float]:
+    lats, lons = decode_cells(cell)
+    return float(lats[0]), float(lons[0])
+
+
+def neighbor_cells(cells) -> np.ndarray:
+    """The 8 surrounding cells of each cell, shape (n, 8), ordered N, NE, E, SE, S, SW, W, NW"""
+    cells = np.atleast_1d(np.asarray(cells, dtype=str))
+    precision = len(cells[0])
+    lats, lons = decode_cells(cells)
+    lat_size, lon_size = cell_size(precision)
+
+    offsets = np.array([(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)], dtype=np.float64)
+    neighbor_lats = np.clip(lats[:, None] + offsets[:, 0] * lat_size, -90.0, 90.0)
+    neighbor_lons = (lons[:, None] + offsets[:, 1] * lon_size + 180.0) % 360.0 - 180.0
+    return encode_cells(neighbor_lats.ravel(), neighbor_lons.ravel(), precision).reshape(len(cells), 8)
+
+
+def parent_cell(cell: str, precision: int) -> str:
+    """Ancestor of a cell at a coarser precision"""
+    return cell[:precision]
+
+
+def child_cells(cell: str) -> List[str]:
+    """The 32 cells one precision level finer"""
+    return [cell + char for char in GEOHASH_ALPHABET]
+
+
+def canonical_cell(lat: float, lon: float, source: str) -> Tuple[str, float, float]:
+    """
+    Canonicalize a coordinate for a data source (a key of config.CELL_PRECISION).
+    Returns (cell id, cell centre latitude, cell centre longitude).
+    """
+    cell = encode_cell(lat, lon, CELL_PRECISION[source])
+    center_lat, center_lon = decode_cell(cell)
+    return cell, center_lat, center_lon
@@ -1,49 +1,117 @@
-import httpx
-from typing import Dict, Any
+import asyncio
+from typing import Dict, Any, Callable, List, Optional, Tuple
 from datetime import datetime
-from config import OPENWEATHER_API_KEY, OPENWEATHER_CURRENT_URL, OPENWEATHER_FORECAST_URL
+from config import OPENWEATHER_API_KEY, OPENWEATHER_CURRENT_URL, OPENWEATHER_FORECAST_URL, CACHE_TTL_WEATHER
+from cache_store import cache_get, cache_set
+from traffic_capture import create_http_client
+from utils import canonical_cell
+from rate_limiter import acquire, burst, pace, seconds_for, UpstreamOverloaded
+from records import WeatherReport, WeatherObservation, ForecastSeries
 
+# OpenWeather requests per uncached cell: current conditions and the forecast
+CALLS_PER_FETCH = 2
 
-async def get_weather_data(lat: float, lon: float) -> Dict[str, Any]:
+# Called as listener(cell, weather_data) whenever fresh weather for a "weather" cell arrives from upstream
+_refresh_listeners: List[Callable[[str, WeatherReport], None]] = []
+
+
+def add_weather_refresh_listener(listener: Callable[[str, WeatherReport], None]):
+    _refresh_listeners.append(listener)
+
+
+async def get_weather_data(lat: float, lon: float) -> WeatherReport:
     """
-    Fetch weather data from OpenWeatherMap free API
+    Fetch weather data from OpenWeatherMap free API.
+    Coordinates are canonicalized to their weather cell, so nearby requests share one fetch.
+    Only the fields the app uses are kept from the upstream responses.
     """
     if not OPENWEATHER_API_KEY:
         return _get_fallback_weather_data()
 
-    async with httpx.AsyncClient() as client:
+    cache_key, lat, lon = canonical_cell(lat, lon, "weather")
+    cached = await cache_get("weather", cache_key, _decode_weather)
+    if cached is not None:
+        return cached
+
+    async with create_http_client() as client:
         try:
+            await acquire("openweather")
             current_url = f"{OPENWEATHER_CURRENT_URL}?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}&units=metric"
             current_response = await client.get(current_url, timeout=10.0)
             current_response.raise_for_status()
-            current_data = current_response.json()
+            observation = WeatherObservation.from_openweather(current_response.json())
 
+            await acquire("openweather")
             forecast_url = f"{OPENWEATHER_FORECAST_URL}?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}&units=metric"
             forecast_response = await client.get(forecast_url, timeout=10.0)
             forecast_response.raise_for_status()
-            forecast_data = forecast_response.json()
+            forecast = ForecastSeries.from_openweather(forecast_response.json())
 
-            return {
-                "current": current_data,
-                "forecast": forecast_data,
-                "timestamp": datetime.now().isoformat()
-            }
+            weather_data = WeatherReport(observation, forecast, datetime.now().isoformat())
+            cache_set("weather", cache_key, weather_data, CACHE_TTL_WEATHER)
+            for listener in _refresh_listeners:
+                listener(cache_key, weather_data)
+            return weather_data
+        except UpstreamOverloaded:
+            raise
         except Exception as e:
             print(f"Weather API error: {str(e)}")
             return _get_fallback_weather_data()
 
 
-def _get_fallback_weather_data() -> Dict[str, Any]:
+async def get_weather_data_many(points: List[Tuple[float, float]], max_seconds: float) -> List[WeatherReport]:
+    """
+    Weather for many points, in order, for batch requests.
+
+    Points in the same weather cell share one fetch, and uncached cells are fetched in waves
+    that fit the OpenWeather burst, so a batch never floods the admission queue. Raises
+    UpstreamOverloaded up front when the uncached cells need more than max_seconds of this
+    worker's OpenWeather quota.
+    """
+    if not OPENWEATHER_API_KEY:
+        return [_get_fallback_weather_data() for _ in points]
+
+    centres: Dict[str, Tuple[float, float]] = {}
+    point_cells = []
+    for lat, lon in points:
+        cell, clat, clon = canonical_cell(lat, lon, "weather")
+        centres.setdefault(cell, (clat, clon))
+        point_cells.append(cell)
+
+    reports: Dict[str, WeatherReport] = {}
+    for cell in centres:
+        cached = await cache_get("weather", cell, _decode_weather)
+        if cached is not None:
+            reports[cell] = cached
+    missing = [cell for cell in centres if cell not in reports]
+
+    needed = seconds_for("openweather", CALLS_PER_FETCH * len(missing))
+    if needed > max_seconds:
+        raise UpstreamOverloaded(
+            "openweather", f"{len(missing)} uncached weather cells need about {needed:.0f}s of quota")
+
+    wave = max(1, burst("openweather") // CALLS_PER_FETCH)
+    for start in range(0, len(missing), wave):
+        cells = missing[start:start + wave]
+        await pace("openweather", CALLS_PER_FETCH * len(cells))
+        fetched = await asyncio.gather(*(get_weather_data(*centres[cell]) for cell in cells))
+        reports.update(zip(cells, fetched))
+    return [reports[cell] for cell in point_cells]
+
+
+def _decode_weather(data: Dict[str, Any]) -> Optional[WeatherReport]:
+    """Shared cache entries from before the typed records are refetched"""
+    return WeatherReport.from_dict(data) if "observation" in data else None
+
+
+def _get_fallback_weather_data() -> WeatherReport:
     """
     Provide fallback weather data when API is unavailable
     """
-    return {
-        "current": {
-            "main": {"temp": 25, "humidity": 60, "pressure": 1013},
-            "weather": [{"description": "clear sky"}],
-            "wind": {"speed": 5}
-        },
-        "forecast": {"list": []},
-        "timestamp": datetime.now().isoformat(),
-        "source": "fallback"
-    }
+    return WeatherReport(
+        WeatherObservation(temp=25, humidity=60, pressure=1013, wind_speed=5, description="clear sky"),
+        ForecastSeries.empty(),
+        datetime.now().isoformat(),
+        source="fallback"
+    )
+